@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import cv2
+import numpy as np
+
+
+# ---------------------- Helpers ----------------------
+def get_sample_image(image_path=None):
+    """Load the given image, or the first profile image when none is given"""
+    from recognition import IMG_DIR, IMAGE_EXTENSIONS
+
+    if image_path is None:
+        candidates = sorted(
+            f for f in os.listdir(IMG_DIR) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not candidates:
+            raise FileNotFoundError(f"No profile images found in {IMG_DIR}")
+        image_path = os.path.join(IMG_DIR, candidates[0])
+
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    return image_path, img
+
+
+def time_calls(fn, runs, warmup=3):
+    """
+    Time repeated calls of fn().
+    Returns: dict with mean wall-clock and CPU milliseconds per call
+    """
+    for _ in range(warmup):
+        fn()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(runs):
+        fn()
+    cpu_ms = (time.process_time() - cpu_start) * 1000.0 / runs
+    wall_ms = (time.perf_counter() - wall_start) * 1000.0 / runs
+
+    return {"wall_ms": wall_ms, "cpu_ms": cpu_ms}
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(title)
+    print("=" * 60)
+
+
+# ---------------------- InsightFace Module Benchmark ----------------------
+def benchmark_insightface_modules(image_path=None, runs=30):
+    """Compare per-frame cost of the full buffalo_l pack vs the kiosk module set"""
+    from recognition import load_insightface_model, KIOSK_MODULES
+
+    image_path, img = get_sample_image(image_path)
+    print_header("INSIGHTFACE MODULE BENCHMARK")
+    print(f"Image: {image_path} {img.shape}")
+    print(f"Runs: {runs}")
+
+    configs = [("full pack", None), ("kiosk", KIOSK_MODULES)]
+    results = {}
+    for label, modules in configs:
+        model = load_insightface_model(modules=modules)
+        loaded = sorted(model.models.keys())
+        results[label] = time_calls(lambda: model.get(img), runs)
+        print(
+            f"{label:>10}: {results[label]['wall_ms']:8.2f} ms wall, "
+            f"{results[label]['cpu_ms']:8.2f} ms CPU per frame  {loaded}"
+        )
+
+    full, kiosk = results["full pack"], results["kiosk"]
+    if full["cpu_ms"] > 0:
+        saving = 100.0 * (full["cpu_ms"] - kiosk["cpu_ms"]) / full["cpu_ms"]
+        print(f"CPU saving per frame: {full['cpu_ms'] - kiosk['cpu_ms']:.2f} ms ({saving:.1f}%)")
+
+    return results
+
+
+# ---------------------- Search Backend Benchmark ----------------------
+def make_synthetic_gallery(size, queries, dim, noise=0.6, seed=0):
+    """
+    Random unit gallery embeddings and noisy probes of known gallery rows
+    Returns: (gallery, probes)
+    """
+    rng = np.random.default_rng(seed)
+    gallery = rng.standard_normal((size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+
+    targets = rng.integers(0, size, queries)
+    probes = gallery[targets] + noise * rng.standard_normal((queries, dim)).astype(
+        np.float32
+    ) / np.sqrt(dim)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return gallery, probes.astype(np.float32)
+
+
+def benchmark_search_backends(sizes=(1000, 10000, 100000), queries=200, runs=3):
+    """Recall@1 against exact search and per-query latency for every backend"""
+    from face_index import (
+        EMBEDDING_DIM,
+        SEARCH_BACKENDS,
+        NumpySearchBackend,
+        build_search_backend,
+        choose_search_backend,
+        faiss,
+    )
+
+    print_header("SEARCH BACKEND BENCHMARK")
+    names = [n for n in SEARCH_BACKENDS if n == "numpy" or faiss is not None]
+    results = {}
+
+    for size in sizes:
+        gallery, probes = make_synthetic_gallery(size, queries, EMBEDDING_DIM)
+        exact_rows = NumpySearchBackend(gallery).search(probes, 1)[1][:, 0]
+        print(f"\nGallery: {size} embeddings, {queries} queries (auto: {choose_search_backend(size)})")
+
+        for name in names:
+            build_start = time.perf_counter()
+            backend = build_search_backend(gallery, backend=name)
+            build_ms = (time.perf_counter() - build_start) * 1000.0
+
+            rows = backend.search(probes, 1)[1][:, 0]
+            recall = float(np.mean(rows == exact_rows))
+
+            # Kiosk frames search one face at a time - time single queries
+            single = probes[:1]
+            latency = time_calls(lambda: backend.search(single, 1), runs * 100, warmup=10)
+            batch = time_calls(lambda: backend.search(probes, 1), runs, warmup=1)
+
+            results[(size, name)] = {
+                "build_ms": build_ms,
+                "recall_at_1": recall,
+                "query_ms": latency["wall_ms"],
+                "batch_ms": batch["wall_ms"],
+            }
+            print(
+                f"{name:>6}: recall@1 {recall:6.3f}  build {build_ms:9.1f} ms  "
+                f"query {latency['wall_ms']:8.3f} ms  batch of {queries} {batch['wall_ms']:8.2f} ms"
+            )
+
+    return results
+
+
+# ---------------------- Liveness Runtime Benchmark ----------------------
+def get_rss_mb():
+    import psutil
+
+    return psutil.Process(os.getpid()).memory_info().rss / (1024.0 * 1024.0)
+
+
+def probe_liveness_runtime(backend, runs=20):
+    """
+    Child-process side of the runtime benchmark: load one backend in a fresh
+    interpreter and print startup time, RSS and batch latency as one JSON line
+    """
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+
+    # Not via liveness_detector - that would also load MediaPipe and InsightFace
+    from liveness_runtime import (
+        LIVENESS_BATCH_BUCKETS,
+        LivenessSession,
+        load_liveness_runtime,
+        warm_up,
+    )
+
+    model_dir = os.path.dirname(os.path.abspath(__file__))
+    runtime = load_liveness_runtime(
+        os.path.join(model_dir, "liveness_model.tflite"),
+        os.path.join(model_dir, "liveness_model.onnx"),
+        backend=backend,
+    )
+    load_s = time.perf_counter() - start
+    if runtime is None:
+        print(json.dumps({"backend": backend, "available": False}))
+        return
+
+    warm_up(runtime)
+    first_s = time.perf_counter() - start
+
+    # Per-call latency of each batch bucket (multi-face frames)
+    session = LivenessSession(runtime)
+    rng = np.random.default_rng(0)
+    crops = [
+        rng.integers(0, 255, (180, 160, 3), dtype=np.uint8)
+        for _ in range(LIVENESS_BATCH_BUCKETS[-1])
+    ]
+    batch_ms = {}
+    for batch_size in LIVENESS_BATCH_BUCKETS:
+        try:
+            timing = time_calls(lambda: session.predict(crops[:batch_size]), runs)
+        except Exception as e:
+            print(f"[WARNING] Batch of {batch_size} failed on {backend}: {e}", file=sys.stderr)
+            break
+        batch_ms[batch_size] = timing["wall_ms"]
+
+    print(
+        json.dumps(
+            {
+                "backend": backend,
+                "available": True,
+                "version": runtime.version,
+                "load_s": load_s,
+                "first_inference_s": first_s,
+                "rss_mb": get_rss_mb(),
+                "rss_added_mb": get_rss_mb() - rss_before,
+                "batch_ms": batch_ms,
+            }
+        )
+    )
+
+
+def benchmark_liveness_runtimes(runs=20):
+    """
+    Startup time, resident memory and per-batch latency of every liveness
+    backend, each in a fresh process
+    """
+    from liveness_runtime import LIVENESS_BACKEND_ORDER
+
+    print_header("LIVENESS RUNTIME BENCHMARK")
+    results = {}
+    for backend in LIVENESS_BACKEND_ORDER:
+        completed = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "liveness-probe",
+                backend,
+                "--runs",
+                str(runs),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        lines = [l for l in completed.stdout.splitlines() if l.startswith("{")]
+        if not lines:
+            print(f"{backend:>15}: probe failed {completed.stderr.strip()[-200:]}")
+            continue
+
+        result = json.loads(lines[-1])
+        results[backend] = result
+        if not result["available"]:
+            print(f"{backend:>15}: not installed or no model file")
+            continue
+        print(
+            f"{backend:>15}: load {result['load_s'] * 1000:8.1f} ms, "
+            f"ready after first inference {result['first_inference_s'] * 1000:8.1f} ms, "
+            f"RSS {result['rss_mb']:7.1f} MB (+{result['rss_added_mb']:.1f} MB)"
+        )
+        for batch_size, ms in result["batch_ms"].items():
+            print(
+                f"{'':>15}  batch of {int(batch_size):>2}: {ms:8.2f} ms per call, "
+                f"{ms / int(batch_size):8.2f} ms per face"
+            )
+
+    return results
+
+
+# ---------------------- Entry Point ----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Face recognition performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    modules_parser = subparsers.add_parser(
+        "modules", help="Full buffalo_l pack vs detection + recognition only"
+    )
+    modules_parser.add_argument("--image", default=None, help="Image to run on")
+    modules_parser.add_argument("--runs", type=int, default=30)
+
+    search_parser = subparsers.add_parser(
+        "search", help="Recall@1 and latency of each vector search backend"
+    )
+    search_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    search_parser.add_argument("--queries", type=int, default=200)
+    search_parser.add_argument("--runs", type=int, default=3)
+
+    liveness_parser = subparsers.add_parser(
+        "liveness", help="Startup time, RSS and batch latency of each liveness backend"
+    )
+    liveness_parser.add_argument("--runs", type=int, default=20)
+    probe_parser = subparsers.add_parser("liveness-probe")  # internal: one backend
+    probe_parser.add_argument("backend")
+    probe_parser.add_argument("--runs", type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "modules":
+        benchmark_insightface_modules(args.image, args.runs)
+    elif args.command == "search":
+        benchmark_search_backends(args.sizes, args.queries, args.runs)
+    elif args.command == "liveness":
+        benchmark_liveness_runtimes(args.runs)
+    elif args.command == "liveness-probe":
+        probe_liveness_runtime(args.backend, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import sys
 import sqlite3
 import datetime
+import threading
 
 
 # ---------------------- Path Utilities ----------------------
@@ -187,14 +188,117 @@ def init_db():
     print("[INFO] Database initialized with strict attendance constraints")
 
 
+# ---------------------- Today's Attendance State ----------------------
+ATTENDANCE_COLUMNS = """
+    id, emp_b_id, emp_code, emp_full_name, checkin_date, checkin_time,
+    checkout_date, checkout_time, status, mode, created_at, updated_at
+"""
+
+
+class TodayAttendanceState:
+    """
+    emp_code -> attendance_logs row for the current IST day, held in memory.
+
+    Loaded on first use and again whenever the IST date changes. Attendance
+    writes in this module update it write-through, so deciding CHECKIN vs
+    CHECKOUT for today needs no database read.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._date = None
+        self._rows = {}
+
+    def _load(self, date):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT {ATTENDANCE_COLUMNS}
+            FROM attendance_logs
+            WHERE checkin_date = ?
+            ORDER BY id
+            """,
+            (date,),
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        # Later rows win, matching the ORDER BY id DESC LIMIT 1 lookups
+        return {row[2]: row for row in rows}
+
+    def _current_rows(self):
+        """Return (date, rows) for today, reloading at the IST day boundary"""
+        today = get_current_date_str()
+        if self._date == today:
+            return self._date, self._rows
+        with self._lock:
+            if self._date != today:
+                self._rows = self._load(today)
+                self._date = today
+                print(
+                    f"[INFO] Loaded today's attendance state for {today}: {len(self._rows)} records"
+                )
+            return self._date, self._rows
+
+    def refresh(self):
+        """Reload today's state from the database now"""
+        with self._lock:
+            self._date = None
+        date, rows = self._current_rows()
+        return len(rows)
+
+    def invalidate(self):
+        with self._lock:
+            self._date = None
+            self._rows = {}
+
+    def get_row(self, emp_code, target_date):
+        """
+        Return (True, row or None) when target_date is today, else (False, None)
+        so the caller falls back to the database.
+        """
+        try:
+            date, rows = self._current_rows()
+        except Exception as e:
+            print(f"[ERROR] Failed to load today's attendance state: {e}")
+            return False, None
+        if target_date != date:
+            return False, None
+        return True, rows.get(emp_code)
+
+    def put_row(self, row):
+        """Write-through update with a full attendance row"""
+        with self._lock:
+            if self._date is not None and row[4] == self._date:
+                self._rows[row[2]] = row
+
+    def apply_checkout(self, emp_code, checkout_date, checkout_time):
+        """Write-through update after a checkout UPDATE"""
+        with self._lock:
+            row = self._rows.get(emp_code) if checkout_date == self._date else None
+            if row is not None:
+                self._rows[emp_code] = (
+                    row[:6] + (checkout_date, checkout_time, "CHECKED_OUT") + row[9:11] + (None,)
+                )
+
+
+today_attendance = TodayAttendanceState()
+
+
 # ---------------------- Enhanced Attendance Functions ----------------------
 def get_employee_attendance_status(emp_code, target_date=None):
     """
     Get detailed attendance status for an employee on a specific date
+    (today's status is served from memory)
     Returns: dict with comprehensive status information
     """
     target_date = normalize_date(target_date)
 
+    is_today, row = today_attendance.get_row(emp_code, target_date)
+    if is_today:
+        return _attendance_status_from_row(row)
+
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
@@ -213,6 +317,11 @@ def get_employee_attendance_status(emp_code, target_date=None):
     result = cursor.fetchone()
     conn.close()
 
+    return _attendance_status_from_row(result)
+
+
+def _attendance_status_from_row(result):
+    """Build the attendance status dict from an attendance_logs row (or None)"""
     if result:
         has_checkout = result[7] is not None  # checkout_time exists
         return {
@@ -294,6 +403,12 @@ def checkin_employee(
 
         conn.commit()
         record_id = cursor.lastrowid
+        today_attendance.put_row(
+            (
+                record_id, emp_b_id, emp_code, emp_full_name, checkin_date, checkin_time,
+                None, None, "CHECKED_IN", "FACE", None, None,
+            )
+        )
 
         print(
             f"✅ CHECK-IN successful for {emp_code} ({emp_full_name}) on {checkin_date} at {checkin_time}"
@@ -366,6 +481,7 @@ def checkout_employee(emp_code, checkout_date=None, checkout_time=None):
             }
 
         conn.commit()
+        today_attendance.apply_checkout(emp_code, checkout_date, checkout_time)
 
         print(
             f"✅ CHECK-OUT updated for {emp_code} on {checkout_date} at {checkout_time}"
@@ -482,13 +598,7 @@ def get_next_attendance_action(emp_code, current_date=None):
     current_date = normalize_date(current_date)
 
     status = get_employee_attendance_status(emp_code, current_date)
-
-    if not status["has_checked_in"]:
-        return "CHECKIN"
-    elif not status["has_checked_out"]:
-        return "CHECKOUT"
-    else:
-        return "COMPLETED"
+    return _next_action_from_status(status)
 
 
 def process_employee_attendance(
@@ -539,6 +649,133 @@ def process_employee_attendance(
         return result
 
 
+def _next_action_from_status(status):
+    if not status["has_checked_in"]:
+        return "CHECKIN"
+    elif not status["has_checked_out"]:
+        return "CHECKOUT"
+    else:
+        return "COMPLETED"
+
+
+def record_attendance_punch(
+    emp_b_id, emp_code, emp_full_name, current_date=None, current_time=None
+):
+    """
+    Single-transaction attendance engine (same rules as process_employee_attendance):
+      - first punch of the day inserts the CHECKIN row
+      - later punches update checkout_time via
+        INSERT ... ON CONFLICT(emp_code, checkin_date) DO UPDATE
+    Uses one connection and one transaction; the pre and post status are
+    derived from the row read inside that transaction.
+    Returns: dict with result details plus pre_status, post_status, next_action
+    """
+    current_date = normalize_date(current_date)
+    current_time = normalize_time(current_time)
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            """
+            SELECT id, emp_b_id, emp_code, emp_full_name, checkin_date, checkin_time,
+                   checkout_date, checkout_time, status, mode, created_at, updated_at
+            FROM attendance_logs
+            WHERE emp_code = ? AND checkin_date = ?
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (emp_code, current_date),
+        )
+        pre_row = cursor.fetchone()
+
+        cursor.execute(
+            """
+            INSERT INTO attendance_logs (
+                emp_b_id, emp_code, emp_full_name, checkin_date, checkin_time, status, mode
+            )
+            VALUES (?, ?, ?, ?, ?, 'CHECKED_IN', 'FACE')
+            ON CONFLICT(emp_code, checkin_date) DO UPDATE SET
+                checkout_date = excluded.checkin_date,
+                checkout_time = excluded.checkin_time,
+                status = 'CHECKED_OUT',
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (emp_b_id, emp_code, emp_full_name, current_date, current_time),
+        )
+        record_id = cursor.lastrowid if pre_row is None else pre_row[0]
+        cursor.execute("COMMIT")
+
+    except Exception as e:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        print(f"[ERROR] Database error during attendance punch: {e}")
+        return {
+            "success": False,
+            "message": f"Database error during attendance processing: {str(e)}",
+            "action": "DATABASE_ERROR",
+            "error": str(e),
+        }
+    finally:
+        conn.close()
+
+    pre_status = _attendance_status_from_row(pre_row)
+
+    if pre_row is None:
+        post_row = (
+            record_id, emp_b_id, emp_code, emp_full_name, current_date, current_time,
+            None, None, "CHECKED_IN", "FACE", None, None,
+        )
+        result = {
+            "success": True,
+            "message": f"Employee {emp_full_name} checked in successfully at {current_time}",
+            "action": "CHECKED_IN",
+            "record_id": record_id,
+            "checkin_date": current_date,
+            "checkin_time": current_time,
+        }
+        print(
+            f"✅ CHECK-IN successful for {emp_code} ({emp_full_name}) on {current_date} at {current_time}"
+        )
+    else:
+        post_row = (
+            pre_row[:6] + (current_date, current_time, "CHECKED_OUT") + pre_row[9:11] + (None,)
+        )
+        result = {
+            "success": True,
+            "message": (
+                "Checkout time updated again"
+                if pre_status["has_checked_out"]
+                else "Checkout time updated successfully"
+            ),
+            "action": (
+                "CHECKOUT_UPDATE" if pre_status["has_checked_out"] else "CHECKED_OUT_UPDATED"
+            ),
+            "record_id": record_id,
+            "checkout_date": current_date,
+            "checkout_time": current_time,
+        }
+        print(
+            f"✅ CHECK-OUT updated for {emp_code} on {current_date} at {current_time}"
+        )
+
+    today_attendance.put_row(post_row)
+    post_status = _attendance_status_from_row(post_row)
+    result.update(
+        {
+            "emp_code": emp_code,
+            "emp_full_name": emp_full_name,
+            "pre_status": pre_status,
+            "post_status": post_status,
+            "pre_next_action": _next_action_from_status(pre_status),
+            "next_action": _next_action_from_status(post_status),
+        }
+    )
+    return result
+
+
 def can_employee_checkin(emp_code, current_date=None):
     """Check if employee can check in today"""
     current_date = normalize_date(current_date)
@@ -672,6 +909,82 @@ def get_daily_attendance_summary(target_date=None):
     return summary
 
 
+# ---------------------- Employee Directory Cache ----------------------
+class EmployeeDirectory:
+    """
+    In-process copy of the employees table indexed by emp_code, emp_b_id and id.
+
+    Loaded once on first use and reloaded lazily after invalidate(), which the
+    employee write functions call, so recognition can look up identity
+    metadata without touching SQLite.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._indexes = None  # (by_code, by_b_id, by_id), replaced as a whole
+
+    def _load(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM employees")
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        by_code = {}
+        by_b_id = {}
+        by_id = {}
+        for row in rows:
+            by_code[row["emp_code"]] = row
+            if row.get("emp_b_id"):
+                by_b_id[str(row["emp_b_id"])] = row
+            by_id[row["id"]] = row
+        return by_code, by_b_id, by_id
+
+    def _get_indexes(self):
+        indexes = self._indexes
+        if indexes is not None:
+            return indexes
+        with self._lock:
+            if self._indexes is None:
+                try:
+                    self._indexes = self._load()
+                    print(f"[INFO] Employee directory loaded: {len(self._indexes[0])} employees")
+                except Exception as e:
+                    print(f"[ERROR] Failed to load employee directory: {e}")
+                    return {}, {}, {}
+            return self._indexes
+
+    def get_by_code(self, emp_code):
+        emp = self._get_indexes()[0].get(emp_code)
+        return dict(emp) if emp else None
+
+    def get_by_b_id(self, emp_b_id):
+        emp = self._get_indexes()[1].get(str(emp_b_id))
+        return dict(emp) if emp else None
+
+    def get_by_id(self, emp_id):
+        emp = self._get_indexes()[2].get(emp_id)
+        return dict(emp) if emp else None
+
+    def count(self):
+        return len(self._get_indexes()[0])
+
+    def invalidate(self):
+        """Drop the cached table; it is reloaded on the next lookup"""
+        with self._lock:
+            self._indexes = None
+
+    def refresh(self):
+        """Reload the cached table now"""
+        self.invalidate()
+        return self.count()
+
+
+employee_directory = EmployeeDirectory()
+
+
 # ---------------------- Employee Functions ----------------------
 def employee_exists(emp_code):
     """Check if employee already exists in database"""
@@ -716,6 +1029,7 @@ def update_employee(
 
     conn.commit()
     conn.close()
+    employee_directory.invalidate()
 
 
 def insert_employee(
@@ -752,6 +1066,7 @@ def insert_employee(
 
     conn.commit()
     conn.close()
+    employee_directory.invalidate()
 
 
 def get_employee_by_code(emp_code):
@@ -857,6 +1172,8 @@ def reset_database(clear_data_only=True):
 
     conn.commit()
     conn.close()
+    employee_directory.invalidate()
+    today_attendance.invalidate()
 
     if not clear_data_only:
         init_db()
@@ -0,0 +1,234 @@
+import os
+import hashlib
+import sqlite3
+import numpy as np
+from database import DATA_DIR
+
+# ---------------------- Configuration ----------------------
+CACHE_DB_PATH = os.path.join(DATA_DIR, "embedding_cache.db")
+
+
+def compute_file_hash(path, chunk_size=1024 * 1024):
+    """Return the SHA-1 hex digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_fingerprint(path, content_hash=None):
+    """
+    Build the cache key for an image file.
+    The content hash is only computed when not supplied by the caller.
+    """
+    stat = os.stat(path)
+    return {
+        "file_path": os.path.abspath(path),
+        "file_size": stat.st_size,
+        "file_mtime_ns": stat.st_mtime_ns,
+        "content_hash": content_hash,
+    }
+
+
+# ---------------------- Embedding Cache ----------------------
+class EmbeddingCache:
+    """
+    Persistent store of face embeddings for profile images.
+
+    Entries are keyed by file path + model name and validated against the
+    file size, mtime and content hash. When size and mtime are unchanged the
+    entry is trusted without reading the file; otherwise the content hash is
+    compared, so images re-downloaded with identical bytes (every fetch
+    rewrites all photos) are not re-encoded. "No face" entries also record
+    the detector configuration that failed, and are retried under any other.
+    """
+
+    def __init__(self, model_name, db_path=CACHE_DB_PATH):
+        self.model_name = model_name
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _init_db(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS face_embeddings (
+                file_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                file_mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                has_face INTEGER NOT NULL DEFAULT 1,
+                embedding BLOB,
+                detector_config TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_path, model_name)
+            )
+            """
+        )
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(face_embeddings)")}
+        if "detector_config" not in columns:
+            # Caches written before detector_config existed: their "no face"
+            # entries match no configuration and are retried once
+            cursor.execute("ALTER TABLE face_embeddings ADD COLUMN detector_config TEXT")
+        conn.commit()
+        conn.close()
+
+    def _load_rows(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT file_path, file_size, file_mtime_ns, content_hash, has_face, embedding,
+                   detector_config
+            FROM face_embeddings
+            WHERE model_name = ?
+            """,
+            (self.model_name,),
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return {row[0]: row for row in rows}
+
+    @staticmethod
+    def _decode_embedding(has_face, blob):
+        if not has_face or blob is None:
+            return None
+        return np.frombuffer(blob, dtype=np.float32).copy()
+
+    def resolve(self, image_paths, detector_config=None):
+        """
+        Split image paths into cache hits and misses.
+        detector_config: current detector settings - "no face" entries
+        recorded under other settings are misses
+        Returns: (hits, misses)
+          hits   - dict path -> embedding (None when the image has no face)
+          misses - dict path -> fingerprint to pass back to store_many()
+        """
+        rows = self._load_rows()
+        hits = {}
+        misses = {}
+        touched = []
+
+        for path in image_paths:
+            try:
+                fingerprint = get_file_fingerprint(path)
+            except OSError as e:
+                print(f"[WARNING] Cannot stat {path}: {e}")
+                continue
+
+            row = rows.get(fingerprint["file_path"])
+            if row is not None and not row[4] and row[6] != detector_config:
+                row = None  # no face under another detector setup - try again
+
+            if row is not None and (
+                row[1] == fingerprint["file_size"]
+                and row[2] == fingerprint["file_mtime_ns"]
+            ):
+                hits[path] = self._decode_embedding(row[4], row[5])
+                continue
+
+            try:
+                fingerprint["content_hash"] = compute_file_hash(path)
+            except OSError as e:
+                print(f"[WARNING] Cannot hash {path}: {e}")
+                continue
+
+            if row is not None and row[3] == fingerprint["content_hash"]:
+                # Same bytes rewritten (e.g. re-downloaded) - refresh stat only
+                hits[path] = self._decode_embedding(row[4], row[5])
+                touched.append(fingerprint)
+                continue
+
+            misses[path] = fingerprint
+
+        if touched:
+            conn = self._connect()
+            conn.executemany(
+                """
+                UPDATE face_embeddings
+                SET file_size = ?, file_mtime_ns = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE file_path = ? AND model_name = ?
+                """,
+                [
+                    (fp["file_size"], fp["file_mtime_ns"], fp["file_path"], self.model_name)
+                    for fp in touched
+                ],
+            )
+            conn.commit()
+            conn.close()
+
+        return hits, misses
+
+    def store_many(self, entries, detector_config=None):
+        """
+        Store freshly computed embeddings.
+        entries: iterable of (fingerprint, embedding or None when no face was found)
+        detector_config: detector settings the entries were computed with
+        """
+        params = []
+        for fingerprint, embedding in entries:
+            has_face = embedding is not None
+            blob = (
+                np.asarray(embedding, dtype=np.float32).tobytes() if has_face else None
+            )
+            params.append(
+                (
+                    fingerprint["file_path"],
+                    self.model_name,
+                    fingerprint["file_size"],
+                    fingerprint["file_mtime_ns"],
+                    fingerprint["content_hash"],
+                    1 if has_face else 0,
+                    blob,
+                    detector_config,
+                )
+            )
+
+        if not params:
+            return 0
+
+        conn = self._connect()
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO face_embeddings (
+                file_path, model_name, file_size, file_mtime_ns, content_hash,
+                has_face, embedding, detector_config
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            params,
+        )
+        conn.commit()
+        conn.close()
+        return len(params)
+
+    def prune(self, keep_paths):
+        """Drop cache entries for images that no longer exist"""
+        keep = {os.path.abspath(p) for p in keep_paths}
+        stale = [path for path in self._load_rows() if path not in keep]
+        if not stale:
+            return 0
+
+        conn = self._connect()
+        conn.executemany(
+            "DELETE FROM face_embeddings WHERE file_path = ? AND model_name = ?",
+            [(path, self.model_name) for path in stale],
+        )
+        conn.commit()
+        conn.close()
+        return len(stale)
+
+    def clear(self):
+        """Remove all cached embeddings for this model"""
+        conn = self._connect()
+        conn.execute(
+            "DELETE FROM face_embeddings WHERE model_name = ?", (self.model_name,)
+        )
+        conn.commit()
+        conn.close()
@@ -0,0 +1,647 @@
+import os
+import glob
+import json
+import math
+import time
+import threading
+from collections import Counter
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # only the NumPy search backend is available
+    faiss = None
+
+# ---------------------- Constants ----------------------
+EMBEDDING_DIM = 512
+
+# ---------------------- Search Backend Selection ----------------------
+# "auto" picks a backend by gallery size; set to one of SEARCH_BACKENDS to force it
+SEARCH_BACKEND = "auto"
+IVF_MIN_GALLERY = 10000  # exact flat search below this many embeddings
+# Every index sync rebuilds the snapshot and HNSW builds are the slowest
+# (~14 s for 20k embeddings vs ~5 s for IVF), so auto mode only picks HNSW
+# when a size is configured here
+HNSW_MIN_GALLERY = None
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_LISTS_PER_SQRT = 4  # nlist = 4 * sqrt(n)
+IVF_MIN_POINTS_PER_LIST = 39  # FAISS k-means needs ~39 training points per list
+IVF_NPROBE = 16
+# Snapshots reuse the trained IVF lists and only re-add changed templates;
+# k-means is re-run once the list count is this far off the gallery size
+IVF_RETRAIN_FACTOR = 2.0
+
+# ---------------------- Template Aggregation ----------------------
+# Employees can have several templates; search this many nearest templates
+# (plus the most templates any one employee has, so a runner-up employee is
+# always among the hits) and aggregate their similarities per identity
+TEMPLATE_SEARCH_K = 5
+TEMPLATE_AGGREGATION = "max"  # "max" (best template) or "mean" (of the identity's hits)
+
+
+# ---------------------- Search Backends ----------------------
+class NumpySearchBackend:
+    """Exact inner-product search with one matmul - needs no FAISS"""
+
+    name = "numpy"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, queries, k):
+        """Returns: (similarities, rows) - rows are -1 for empty slots"""
+        n = len(self)
+        k_found = min(k, n)
+        sims = queries @ self.vectors.T
+
+        if k_found < n:
+            top = np.argpartition(-sims, k_found - 1, axis=1)[:, :k_found]
+        else:
+            top = np.broadcast_to(np.arange(n), (queries.shape[0], n))
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        rows = np.take_along_axis(top, order, axis=1).astype(np.int64)
+        top_sims = np.take_along_axis(top_sims, order, axis=1).astype(np.float32)
+
+        if k_found < k:
+            pad = k - k_found
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+            top_sims = np.pad(top_sims, ((0, 0), (0, pad)))
+        return top_sims, rows
+
+
+class FaissSearchBackend:
+    """Base for FAISS backends: subclasses build self.index from the vectors"""
+
+    name = None
+    persist_index = True  # write the index next to the vectors (see save_index_files)
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.index = self.build_index(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def build_index(self, vectors):
+        raise NotImplementedError
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, queries, k):
+        """Returns: (similarities, rows) - rows are -1 for empty slots"""
+        return self.index.search(queries, k)
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path, vectors):
+        """Load a written index, memory-mapped where FAISS supports it"""
+        backend = cls.__new__(cls)
+        backend.vectors = vectors
+        try:
+            backend.index = faiss.read_index(
+                path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            backend.index = faiss.read_index(path)
+        return backend
+
+
+class FlatSearchBackend(FaissSearchBackend):
+    """Exact inner-product search (IndexFlatIP)"""
+
+    name = "flat"
+    # IO_FLAG_MMAP does not map an IndexFlat - every process would read its own
+    # copy. Loaders search the memory-mapped vectors with NumPy instead
+    persist_index = False
+
+    def build_index(self, vectors):
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        return index
+
+
+class HNSWSearchBackend(FaissSearchBackend):
+    """Approximate graph search (IndexHNSWFlat, inner product)"""
+
+    name = "hnsw"
+
+    def build_index(self, vectors):
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(vectors)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+
+def ivf_list_count(gallery_size):
+    """Number of inverted lists to train for a gallery of the given size"""
+    nlist = int(IVF_LISTS_PER_SQRT * math.sqrt(gallery_size))
+    return max(1, min(nlist, gallery_size // IVF_MIN_POINTS_PER_LIST))
+
+
+class IVFSearchBackend(FaissSearchBackend):
+    """
+    Approximate inverted-list search (IndexIVFFlat, inner product). Template
+    rows are the FAISS ids, so a gallery change is applied as
+    remove_ids/add_with_ids on a copy instead of a new k-means run.
+    """
+
+    name = "ivf"
+
+    def build_index(self, vectors):
+        n, dim = vectors.shape
+        nlist = ivf_list_count(n)
+
+        # The IVF index does not own its quantizer - keep a reference
+        self.quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(self.quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+        index.nprobe = min(IVF_NPROBE, nlist)
+        return index
+
+    def updated(self, vectors, changed_rows):
+        """
+        Backend over vectors that differ from this one's in changed_rows
+        (rows past the end count as removed). This backend is left untouched
+        for the snapshots still searching it.
+        Returns: the new backend, or None when the lists need retraining
+        """
+        n = len(vectors)
+        nlist = self.index.nlist
+        ideal = ivf_list_count(n)
+        if nlist > ideal * IVF_RETRAIN_FACTOR or nlist * IVF_RETRAIN_FACTOR < ideal:
+            return None
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        backend = IVFSearchBackend.__new__(IVFSearchBackend)
+        backend.vectors = vectors
+        try:
+            index = faiss.clone_index(self.index)
+            rows = np.fromiter(sorted(changed_rows), dtype=np.int64)
+            if len(rows):
+                index.remove_ids(rows)
+                rows = rows[rows < n]
+                index.add_with_ids(vectors[rows], rows)
+        except RuntimeError:
+            # Memory-mapped lists cannot be copied - keep the trained
+            # centroids and re-add the gallery
+            backend.quantizer = faiss.clone_index(faiss.extract_index_ivf(self.index).quantizer)
+            index = faiss.IndexIVFFlat(
+                backend.quantizer, self.index.d, nlist, faiss.METRIC_INNER_PRODUCT
+            )
+            index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+        index.nprobe = min(IVF_NPROBE, nlist)
+        backend.index = index
+        return backend
+
+
+SEARCH_BACKENDS = {
+    "numpy": NumpySearchBackend,
+    "flat": FlatSearchBackend,
+    "hnsw": HNSWSearchBackend,
+    "ivf": IVFSearchBackend,
+}
+
+
+def choose_search_backend(gallery_size):
+    """Pick the backend name for a gallery of the given size"""
+    if faiss is None:
+        return "numpy"
+    if HNSW_MIN_GALLERY is not None and gallery_size >= HNSW_MIN_GALLERY:
+        return "hnsw"
+    if gallery_size >= IVF_MIN_GALLERY:
+        return "ivf"
+    return "flat"
+
+
+def resolve_search_backend(gallery_size, backend=None):
+    """Backend name to use for a gallery: the configured one, or chosen by size"""
+    name = backend or SEARCH_BACKEND
+    if name == "auto":
+        name = choose_search_backend(gallery_size)
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend: {name}")
+    if name != "numpy" and faiss is None:
+        print(f"[WARNING] FAISS not available, using NumPy search instead of {name}")
+        name = "numpy"
+    return name
+
+
+def build_search_backend(vectors, backend=None):
+    """Build the configured (or automatically chosen) backend over (N, dim) vectors"""
+    return SEARCH_BACKENDS[resolve_search_backend(len(vectors), backend)](vectors)
+
+
+# ---------------------- Mutable Face Gallery ----------------------
+class FaceIndex:
+    """
+    Mutable gallery of template embeddings keyed by template code.
+
+    A template code is the profile image name (EMP001, EMP001_2, ...) and
+    each template belongs to an identity (the employee code). Single
+    templates can be added, removed or replaced in place without re-encoding
+    the gallery. Searching happens on snapshots, which build the search
+    backend suited to the gallery size - or update the previous snapshot's
+    backend with the rows changed since, where the backend supports it.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dim), dtype=np.float32)  # grows by doubling
+        self._codes = []
+        self._identities = []
+        self._row_by_code = {}
+        self._backend = None  # backend of the last snapshot, updated in place of a rebuild
+        self._changed_rows = set()  # rows changed since that snapshot
+
+    @classmethod
+    def from_vectors(cls, vectors, codes, identities=None, backend=None):
+        """
+        Build a gallery over existing (N, dim) vectors. Read-only (memory-mapped)
+        vectors are only copied on the first change.
+        backend: search backend already built over these vectors, if any
+        """
+        index = cls(vectors.shape[1])
+        index._vectors = vectors
+        index._codes = list(codes)
+        index._identities = list(identities) if identities is not None else list(codes)
+        index._row_by_code = {code: row for row, code in enumerate(index._codes)}
+        index._backend = backend
+        return index
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build a gallery over a (loaded) snapshot, reusing its vectors and search backend"""
+        return cls.from_vectors(
+            snapshot.vectors, snapshot.codes, snapshot.identities, backend=snapshot._backend
+        )
+
+    def _make_writable(self):
+        if not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def codes(self):
+        """Template codes currently in the index"""
+        with self._lock:
+            return list(self._codes)
+
+    @property
+    def identities(self):
+        """Employee code of each template, in codes order"""
+        with self._lock:
+            return list(self._identities)
+
+    def contains(self, emp_code):
+        return emp_code in self._row_by_code
+
+    def _as_matrix(self, embeddings):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {matrix.shape[1]} does not match index dimension {self.dim}"
+            )
+        return matrix
+
+    def add(self, emp_code, embedding, identity=None):
+        """
+        Add a template embedding (replaces any existing entry for the code).
+        identity: employee code the template belongs to (defaults to emp_code)
+        """
+        with self._lock:
+            if emp_code in self._row_by_code:
+                return self.replace(emp_code, embedding, identity)
+
+            vector = self._as_matrix(embedding)[0]
+            self._make_writable()
+            row = len(self._codes)
+            if row == self._vectors.shape[0]:
+                grown = np.zeros((max(16, 2 * row), self.dim), dtype=np.float32)
+                grown[:row] = self._vectors[:row]
+                self._vectors = grown
+
+            self._vectors[row] = vector
+            self._codes.append(emp_code)
+            self._identities.append(identity if identity is not None else emp_code)
+            self._row_by_code[emp_code] = row
+            self._changed_rows.add(row)
+
+    def remove(self, emp_code):
+        """Remove an employee from the index. Returns True if it was present"""
+        with self._lock:
+            row = self._row_by_code.pop(emp_code, None)
+            if row is None:
+                return False
+
+            # Move the last entry into the hole to keep rows contiguous
+            self._make_writable()
+            last = len(self._codes) - 1
+            if row != last:
+                moved_code = self._codes[last]
+                self._vectors[row] = self._vectors[last]
+                self._codes[row] = moved_code
+                self._identities[row] = self._identities[last]
+                self._row_by_code[moved_code] = row
+            self._codes.pop()
+            self._identities.pop()
+            self._changed_rows.update((row, last))
+            return True
+
+    def replace(self, emp_code, embedding, identity=None):
+        """Replace a template's embedding in place"""
+        with self._lock:
+            row = self._row_by_code.get(emp_code)
+            if row is None:
+                return self.add(emp_code, embedding, identity)
+            self._make_writable()
+            self._vectors[row] = self._as_matrix(embedding)[0]
+            if identity is not None:
+                self._identities[row] = identity
+            self._changed_rows.add(row)
+
+    def relabel(self, identity_of):
+        """
+        Recompute every template's identity with identity_of(code).
+        Returns: number of templates whose identity changed
+        """
+        with self._lock:
+            changed = 0
+            for row, code in enumerate(self._codes):
+                identity = identity_of(code)
+                if identity != self._identities[row]:
+                    self._identities[row] = identity
+                    changed += 1
+            return changed
+
+    def vectors(self):
+        """Copy of the (N, dim) embedding matrix, rows in codes order"""
+        with self._lock:
+            return self._vectors[: len(self._codes)].copy()
+
+    def snapshot(self, backend=None):
+        """
+        Return an immutable, searchable copy of the gallery. The previous
+        snapshot's backend is updated with the changed rows when it is the
+        same kind and supports it (IVF), otherwise the backend is built anew.
+        """
+        with self._lock:
+            vectors = self.vectors()
+            codes = list(self._codes)
+            identities = list(self._identities)
+            if not codes:
+                return FaceIndexSnapshot(dim=self.dim)
+
+            name = resolve_search_backend(len(codes), backend)
+            built = None
+            previous = self._backend
+            if previous is not None and previous.name == name and hasattr(previous, "updated"):
+                built = previous.updated(vectors, self._changed_rows)
+                if built is None:
+                    print(f"[INFO] Retraining {name} search backend for {len(codes)} templates")
+            if built is None:
+                built = SEARCH_BACKENDS[name](vectors)
+            if backend is None:
+                # Only the configured backend is published and worth updating
+                self._backend = built
+                self._changed_rows.clear()
+        return FaceIndexSnapshot(
+            vectors, codes, self.dim, backend=built, identities=identities
+        )
+
+    def clear(self):
+        """Remove every entry from the index"""
+        with self._lock:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._codes.clear()
+            self._identities.clear()
+            self._row_by_code.clear()
+            self._backend = None
+            self._changed_rows.clear()
+
+    def search(self, embeddings, k=1):
+        """
+        Exact search of normalized query embeddings against the live gallery.
+        Returns: (similarities, codes) where codes[i][j] is None for empty slots
+        """
+        return self.snapshot(backend="numpy").search(embeddings, k)
+
+
+# ---------------------- Immutable Index Snapshot ----------------------
+class FaceIndexSnapshot:
+    """
+    Read-only search backend + row->template code / identity tables published
+    to recognition threads.
+
+    A snapshot is never mutated after construction, so the index and its code
+    table always belong together and can be searched without locking. Updates
+    build a new snapshot and swap the reference.
+    """
+
+    def __init__(
+        self, vectors=None, codes=None, dim=EMBEDDING_DIM, backend=None, identities=None
+    ):
+        """
+        backend: backend name, None for SEARCH_BACKEND, or an already built backend
+        identities: employee code per template (defaults to the template codes)
+        """
+        self.dim = dim
+        self.vectors = (
+            vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        )
+        self._codes = list(codes or [])
+        self._identities = list(identities) if identities is not None else list(self._codes)
+        self.max_templates = max(Counter(self._identities).values(), default=0)
+        if not self._codes:
+            self._backend = None
+        elif backend is None or isinstance(backend, str):
+            self._backend = build_search_backend(self.vectors, backend)
+        else:
+            self._backend = backend
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def codes(self):
+        """Template codes in this snapshot"""
+        return list(self._codes)
+
+    @property
+    def identities(self):
+        """Employee code of each template, in codes order"""
+        return list(self._identities)
+
+    @property
+    def identity_count(self):
+        return len(set(self._identities))
+
+    @property
+    def backend_name(self):
+        return self._backend.name if self._backend is not None else None
+
+    def search(self, embeddings, k=1):
+        """
+        Search normalized query embeddings.
+        Returns: (similarities, codes) where codes[i][j] is None for empty slots
+        """
+        queries = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        if self._backend is None:
+            sims = np.zeros((queries.shape[0], k), dtype=np.float32)
+            return sims, [[None] * k for _ in range(queries.shape[0])]
+
+        sims, rows = self._backend.search(queries, k)
+        sims = np.where(rows >= 0, sims, 0.0).astype(np.float32)
+        codes = [[self._codes[row] if row >= 0 else None for row in r] for r in rows]
+        return sims, codes
+
+    def search_identities(self, embeddings, k=TEMPLATE_SEARCH_K, aggregation=None):
+        """
+        Search the k nearest templates and aggregate their similarities per
+        identity (TEMPLATE_AGGREGATION: best template or mean of its hits).
+        The search is widened by max_templates, so one employee's templates
+        cannot fill every slot and hide the runner-up identity.
+        Returns: per query, a list of (identity, score, template_hits) sorted
+        by score - empty when the snapshot is empty
+        """
+        aggregation = aggregation or TEMPLATE_AGGREGATION
+        queries = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        if self._backend is None:
+            return [[] for _ in range(queries.shape[0])]
+
+        sims, rows = self._backend.search(
+            queries, min(k + self.max_templates, len(self._codes))
+        )
+        ranked = []
+        for query_sims, query_rows in zip(sims, rows):
+            per_identity = {}
+            for sim, row in zip(query_sims, query_rows):
+                if row < 0:
+                    continue
+                per_identity.setdefault(self._identities[row], []).append(float(sim))
+
+            scored = [
+                (
+                    identity,
+                    max(hits) if aggregation == "max" else sum(hits) / len(hits),
+                    len(hits),
+                )
+                for identity, hits in per_identity.items()
+            ]
+            scored.sort(key=lambda item: (item[1], item[2]), reverse=True)
+            ranked.append(scored)
+        return ranked
+
+
+# ---------------------- Persistence ----------------------
+def save_index_files(snapshot, directory, name, metadata):
+    """
+    Write a snapshot as <name>-<tag>.npy (+ <name>-<tag>.faiss for FAISS
+    backends other than flat) and the manifest <name>.json holding the code
+    table and metadata. The manifest is replaced last, so readers always find
+    a complete set; files it no longer references are removed afterwards.
+    """
+    tag = f"{time.time_ns():x}"
+    vectors_file = f"{name}-{tag}.npy"
+    index_file = None
+
+    with open(os.path.join(directory, vectors_file), "wb") as f:
+        np.save(f, np.ascontiguousarray(snapshot.vectors, dtype=np.float32))
+
+    if isinstance(snapshot._backend, FaissSearchBackend) and snapshot._backend.persist_index:
+        index_file = f"{name}-{tag}.faiss"
+        snapshot._backend.save(os.path.join(directory, index_file))
+
+    manifest = dict(metadata)
+    manifest.update(
+        {
+            "dim": snapshot.dim,
+            "codes": snapshot.codes,
+            "identities": snapshot.identities,
+            "backend": snapshot.backend_name,
+            "vectors_file": vectors_file,
+            "index_file": index_file,
+        }
+    )
+    manifest_path = os.path.join(directory, f"{name}.json")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+    for pattern in (f"{name}-*.npy", f"{name}-*.faiss"):
+        for path in glob.glob(os.path.join(directory, pattern)):
+            if os.path.basename(path) not in (vectors_file, index_file):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # still mapped by another process - removed next time
+
+
+def load_index_files(directory, name, mmap=True):
+    """
+    Load a snapshot written by save_index_files. Vectors are opened with
+    numpy mmap_mode, so their pages are shared between processes; flat
+    galleries are searched straight from them with NumPy. IVF indexes are
+    opened with IO_FLAG_MMAP, which maps their inverted lists; HNSW graphs
+    are read into memory.
+    Returns: (snapshot, manifest) or (None, None) when missing or unreadable
+    """
+    manifest_path = os.path.join(directory, f"{name}.json")
+    if not os.path.exists(manifest_path):
+        return None, None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        vectors = np.load(
+            os.path.join(directory, manifest["vectors_file"]),
+            mmap_mode="r" if mmap else None,
+        )
+        codes = manifest["codes"]
+        if vectors.ndim != 2 or vectors.shape != (len(codes), manifest["dim"]):
+            print(f"[WARNING] Persisted index {name} is inconsistent, ignoring it")
+            return None, None
+
+        backend = manifest.get("backend")
+        index_file = manifest.get("index_file")
+        if index_file and faiss is not None and backend in SEARCH_BACKENDS:
+            backend = SEARCH_BACKENDS[backend].load(
+                os.path.join(directory, index_file), vectors
+            )
+        elif backend == "flat":
+            backend = NumpySearchBackend(vectors)
+        # otherwise the backend is built from the vectors (NumPy needs no build)
+
+        snapshot = FaceIndexSnapshot(
+            vectors,
+            codes,
+            manifest["dim"],
+            backend=backend,
+            identities=manifest.get("identities"),
+        )
+        return snapshot, manifest
+
+    except Exception as e:
+        print(f"[WARNING] Failed to load persisted index {name}: {e}")
+        return None, None
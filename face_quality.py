@@ -0,0 +1,177 @@
+import threading
+import cv2
+import numpy as np
+
+# ---------------------- Quality Thresholds ----------------------
+# Tune these against get_quality_stats(): every rejected frame skips the
+# liveness model, ArcFace embedding and index search.
+QUALITY_THRESHOLDS = {
+    "min_face_px": 80,  # shorter side of the detection box, in frame pixels
+    "min_sharpness": 60.0,  # Laplacian variance of the face at 112px width
+    "max_yaw_ratio": 0.35,  # |nose - eye midpoint| / eye distance
+    "max_ear_asymmetry": 0.45,  # |d(nose, right ear) - d(nose, left ear)| / sum
+    "min_brightness": 50.0,  # mean luminance
+    "max_brightness": 210.0,
+    "max_dark_fraction": 0.5,  # share of pixels below 20
+    "max_bright_fraction": 0.3,  # share of pixels above 235
+}
+
+QUALITY_SAMPLE_WIDTH = 112
+QUALITY_LOG_EVERY = 100  # print reject statistics every N assessments
+
+
+# ---------------------- Quality Statistics ----------------------
+class QualityStats:
+    """Counters of assessed, passed and rejected faces per reason"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.assessed = 0
+        self.passed = 0
+        self.rejected_by_reason = {}
+
+    def record(self, reasons):
+        with self._lock:
+            self.assessed += 1
+            if not reasons:
+                self.passed += 1
+            for reason in reasons:
+                self.rejected_by_reason[reason] = self.rejected_by_reason.get(reason, 0) + 1
+            should_log = self.assessed % QUALITY_LOG_EVERY == 0
+
+        if should_log:
+            stats = self.snapshot()
+            print(
+                f"[INFO] Face quality gate: {stats['passed']}/{stats['assessed']} passed, "
+                f"rejects: {stats['rejected_by_reason']}"
+            )
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "assessed": self.assessed,
+                "passed": self.passed,
+                "rejected": self.assessed - self.passed,
+                "rejected_by_reason": dict(self.rejected_by_reason),
+            }
+
+
+quality_stats = QualityStats()
+
+
+def get_quality_stats():
+    return quality_stats.snapshot()
+
+
+# ---------------------- Quality Measures ----------------------
+def measure_sharpness(gray):
+    """Laplacian variance - low values mean motion blur or defocus"""
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def measure_exposure(gray):
+    """Mean luminance and shares of crushed / clipped pixels from one histogram"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = max(hist.sum(), 1.0)
+    mean = float(np.dot(hist, np.arange(256)) / total)
+    dark_fraction = float(hist[:20].sum() / total)
+    bright_fraction = float(hist[236:].sum() / total)
+    return mean, dark_fraction, bright_fraction
+
+
+def measure_pose(keypoints):
+    """
+    Yaw indicators from MediaPipe keypoints (right eye, left eye, nose tip,
+    mouth center, right ear tragion, left ear tragion).
+    Returns: (yaw_ratio, ear_asymmetry) - ear_asymmetry is None without ear points
+    """
+    points = np.asarray(keypoints, dtype=np.float32)
+    eyes, nose = points[:2], points[2]
+    eye_distance = max(float(np.linalg.norm(eyes[1] - eyes[0])), 1e-6)
+    yaw_ratio = abs(float(nose[0] - eyes[:, 0].mean())) / eye_distance
+
+    ear_asymmetry = None
+    if len(points) >= 6:
+        d_right = float(np.linalg.norm(points[4] - nose))
+        d_left = float(np.linalg.norm(points[5] - nose))
+        ear_asymmetry = abs(d_right - d_left) / max(d_right + d_left, 1e-6)
+
+    return yaw_ratio, ear_asymmetry
+
+
+# ---------------------- Quality Gate ----------------------
+def assess_face_quality(face_img, box=None, keypoints=None, thresholds=None):
+    """
+    Cheap quality check run before liveness and embedding.
+    face_img: BGR crop; box: (x1, y1, x2, y2) detection box in frame pixels;
+    keypoints: MediaPipe keypoints in frame pixels
+    Returns: dict with ok, reasons (list of reject reason keys) and scores
+    """
+    limits = dict(QUALITY_THRESHOLDS)
+    if thresholds:
+        limits.update(thresholds)
+
+    reasons = []
+    scores = {}
+
+    if face_img is None or face_img.size == 0:
+        quality_stats.record(["empty"])
+        return {"ok": False, "reasons": ["empty"], "scores": scores}
+
+    if box is not None:
+        face_px = float(min(box[2] - box[0], box[3] - box[1]))
+        scores["face_px"] = face_px
+        if face_px < limits["min_face_px"]:
+            reasons.append("too_small")
+
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim == 3 else face_img
+    h, w = gray.shape[:2]
+    sample_h = max(1, int(round(h * QUALITY_SAMPLE_WIDTH / float(w))))
+    gray = cv2.resize(gray, (QUALITY_SAMPLE_WIDTH, sample_h), interpolation=cv2.INTER_AREA)
+
+    scores["sharpness"] = measure_sharpness(gray)
+    if scores["sharpness"] < limits["min_sharpness"]:
+        reasons.append("blurry")
+
+    mean, dark_fraction, bright_fraction = measure_exposure(gray)
+    scores.update(
+        {
+            "brightness": mean,
+            "dark_fraction": dark_fraction,
+            "bright_fraction": bright_fraction,
+        }
+    )
+    if mean < limits["min_brightness"] or dark_fraction > limits["max_dark_fraction"]:
+        reasons.append("too_dark")
+    elif mean > limits["max_brightness"] or bright_fraction > limits["max_bright_fraction"]:
+        reasons.append("overexposed")
+
+    if keypoints is not None and len(keypoints) >= 3:
+        yaw_ratio, ear_asymmetry = measure_pose(keypoints)
+        scores["yaw_ratio"] = yaw_ratio
+        if ear_asymmetry is not None:
+            scores["ear_asymmetry"] = ear_asymmetry
+        if yaw_ratio > limits["max_yaw_ratio"] or (
+            ear_asymmetry is not None and ear_asymmetry > limits["max_ear_asymmetry"]
+        ):
+            reasons.append("side_pose")
+
+    quality_stats.record(reasons)
+    return {"ok": not reasons, "reasons": reasons, "scores": scores}
+
+
+QUALITY_REASON_MESSAGES = {
+    "empty": "no face region",
+    "too_small": "move closer",
+    "blurry": "hold still",
+    "too_dark": "too dark",
+    "overexposed": "too bright",
+    "side_pose": "look straight at the camera",
+}
+
+
+def describe_quality_reasons(reasons):
+    return ", ".join(QUALITY_REASON_MESSAGES.get(r, r) for r in reasons)
@@ -0,0 +1,310 @@
+import time
+import threading
+from collections import deque
+import cv2
+import numpy as np
+
+# ---------------------- Tracker Settings ----------------------
+TRACK_IOU_THRESHOLD = 0.3  # minimum IoU to continue a track
+TRACK_MAX_CENTROID_SHIFT = 0.5  # fallback match: centroid shift / box diagonal
+TRACK_MAX_MISSED_SECONDS = 2.0  # a track unseen this long is lost
+# Detection runs about once a second, so a single missed frame is enough for
+# one person to leave and another to step into the same box: drop the track
+TRACK_MAX_MISSED_FRAMES = 0
+TRACK_REVERIFY_SECONDS = 30.0  # re-embed a stable track at least this often
+TRACK_MIN_DET_SCORE = 0.7  # re-embed when detector confidence drops below this
+TRACK_APPEARANCE_SIZE = 12  # colour thumbnail edge for the per-frame appearance check
+# Below this the box holds a different person. Detection-box thumbnails on the
+# kiosk background: same person 0.85+ (noise, lighting, box jitter), different
+# people 0.66 at most
+TRACK_MIN_APPEARANCE_CORR = 0.75
+
+# ---------------------- Liveness Voting Settings ----------------------
+# A track's liveness is decided from its last few model scores, not one frame,
+# and the verdict is then kept for the lifetime of the track
+LIVENESS_WINDOW = 5  # scores kept per track
+LIVENESS_AGGREGATION = "mean"  # "mean", "ema" or "k_of_n"
+LIVENESS_MIN_VOTES = 2  # mean / ema: scores needed before deciding
+LIVENESS_EMA_ALPHA = 0.5  # ema: weight of the newest score
+LIVENESS_K = 3  # k_of_n: votes on one side that settle the verdict
+LIVENESS_CONFIDENT_MARGIN = 0.35  # a single score this far from the threshold decides at once
+# Spoof cascade verdicts are kept apart from model scores: only this many
+# agreeing ones in a row, before the model has scored the track, settle it
+LIVENESS_CASCADE_HITS = 3
+TRACK_THUMBNAILS = 4  # face thumbnails kept for the spoof cascade's motion check
+
+
+def aggregate_liveness(scores, threshold, method=None):
+    """
+    Vote over a track's recent liveness scores (below threshold = live).
+    Returns: True (live), False (spoof) or None when undecided
+    """
+    method = method or LIVENESS_AGGREGATION
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(scores) == 0:
+        return None
+
+    if method == "k_of_n":
+        live_votes = int((scores < threshold).sum())
+        if live_votes >= LIVENESS_K:
+            return True
+        if len(scores) - live_votes >= LIVENESS_K:
+            return False
+        return None
+
+    if len(scores) == 1 and abs(float(scores[0]) - threshold) >= LIVENESS_CONFIDENT_MARGIN:
+        return bool(scores[0] < threshold)
+    if len(scores) < LIVENESS_MIN_VOTES:
+        return None
+
+    if method == "ema":
+        value = float(scores[0])
+        for score in scores[1:]:
+            value = LIVENESS_EMA_ALPHA * float(score) + (1.0 - LIVENESS_EMA_ALPHA) * value
+    else:
+        value = float(scores.mean())
+    return value < threshold
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """IoU between every pair of (x1, y1, x2, y2) boxes. Returns (len(a), len(b))"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def appearance_thumbnail(face_img):
+    """
+    Small zero-mean, unit-variance colour thumbnail of a face - pass the
+    detection box only, a margin crop is mostly background
+    """
+    thumb = cv2.resize(
+        face_img, (TRACK_APPEARANCE_SIZE, TRACK_APPEARANCE_SIZE), interpolation=cv2.INTER_AREA
+    ).astype(np.float32)
+    thumb -= thumb.mean()
+    thumb /= max(float(thumb.std()), 1e-6)
+    return thumb
+
+
+def appearance_similarity(thumb_a, thumb_b):
+    """Normalized cross-correlation of two appearance thumbnails (1.0 = identical)"""
+    return float(np.mean(thumb_a * thumb_b))
+
+
+# ---------------------- Face Track ----------------------
+class FaceTrack:
+    """One face followed across frames, with its cached recognition verdicts"""
+
+    def __init__(self, track_id, bbox, det_score, now):
+        self.track_id = track_id
+        self.bbox = tuple(bbox)
+        self.det_score = det_score
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.missed = 0  # consecutive frames without a matching detection
+        self.appearance = None  # thumbnail the cached verdicts were taken on
+        self.identity = None  # last successful recognition result
+        self.identity_at = None
+        self.liveness = None  # voted verdict, kept for the lifetime of the track
+        self.liveness_scores = deque(maxlen=LIVENESS_WINDOW)
+        self.liveness_code = None  # employee the cached verdict was confirmed for
+        self.cascade_votes = deque(maxlen=LIVENESS_CASCADE_HITS)
+        self.thumbnails = deque(maxlen=TRACK_THUMBNAILS)
+
+    @property
+    def is_new(self):
+        return self.hits == 1
+
+    def needs_recognition(self, now=None):
+        """True when the face has to be embedded and searched again"""
+        now = time.monotonic() if now is None else now
+        if self.identity is None:
+            return True
+        if self.det_score is not None and self.det_score < TRACK_MIN_DET_SCORE:
+            return True
+        return now - self.identity_at > TRACK_REVERIFY_SECONDS
+
+    def set_identity(self, result, now=None, appearance=None):
+        self.identity = result
+        self.identity_at = time.monotonic() if now is None else now
+        self.liveness_code = result.get("emp_code")
+        if appearance is not None:
+            self.appearance = appearance
+
+    def clear_identity(self):
+        self.identity = None
+        self.identity_at = None
+
+    def reset_liveness(self):
+        """Forget the liveness vote so the face is voted on again"""
+        self.liveness = None
+        self.liveness_scores.clear()
+        self.liveness_code = None
+        self.cascade_votes.clear()
+
+    def reset_verdicts(self):
+        """Forget the cached identity and liveness vote - another person is in the box"""
+        self.clear_identity()
+        self.reset_liveness()
+        self.thumbnails.clear()
+        self.appearance = None
+
+    def check_appearance(self, appearance):
+        """
+        Compare this frame's face with the one the cached verdicts were taken
+        on, so a person stepping into someone else's box cannot inherit them.
+        Returns: True when it is the same face; on a mismatch the verdicts are
+        dropped and False is returned
+        """
+        if self.appearance is None:
+            self.appearance = appearance
+            return True
+        similarity = appearance_similarity(self.appearance, appearance)
+        if similarity >= TRACK_MIN_APPEARANCE_CORR:
+            return True
+        print(
+            f"[INFO] Track {self.track_id}: appearance changed "
+            f"(correlation {similarity:.2f}), dropping cached verdicts"
+        )
+        self.reset_verdicts()
+        self.appearance = appearance
+        return False
+
+    def add_liveness_score(self, score, threshold):
+        """
+        Record one liveness model score and vote over the ring buffer.
+        Returns: the track's verdict - True, False or None while undecided
+        """
+        if self.liveness is None:
+            self.liveness_scores.append(float(score))
+            self.liveness = aggregate_liveness(self.liveness_scores, threshold)
+        return self.liveness
+
+    def add_cascade_verdict(self, verdict):
+        """
+        Record one spoof cascade verdict in place of a model call. Only taken
+        while the model has not scored the track, so a heuristic never
+        outvotes the model; LIVENESS_CASCADE_HITS agreeing verdicts in a row
+        settle the track.
+        Returns: True when the verdict was taken (self.liveness is the track's
+        verdict, None while undecided), False when the crop needs the model
+        """
+        if verdict is None or self.liveness_scores:
+            self.cascade_votes.clear()
+            return False
+        self.cascade_votes.append(verdict)
+        if len(self.cascade_votes) == LIVENESS_CASCADE_HITS and len(set(self.cascade_votes)) == 1:
+            self.liveness = verdict
+        return True
+
+
+# ---------------------- Face Tracker ----------------------
+class FaceTracker:
+    """
+    Greedy IoU tracker with a centroid-distance fallback.
+    update() maps each detection in a frame to a persistent FaceTrack.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracks = {}
+        self._next_id = 1
+        self.tracks_created = 0
+
+    def _expire(self, now):
+        for track_id in [
+            tid
+            for tid, track in self._tracks.items()
+            if now - track.last_seen > TRACK_MAX_MISSED_SECONDS
+        ]:
+            del self._tracks[track_id]
+
+    def update(self, boxes, scores=None, now=None):
+        """
+        Associate this frame's detections with tracks.
+        boxes: list of (x1, y1, x2, y2); scores: detector confidences
+        Returns: list of FaceTrack in the same order as boxes
+        """
+        now = time.monotonic() if now is None else now
+        scores = list(scores) if scores is not None else [None] * len(boxes)
+
+        with self._lock:
+            self._expire(now)
+            tracks = list(self._tracks.values())
+            assigned = [None] * len(boxes)
+
+            if boxes and tracks:
+                det_boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+                track_boxes = np.asarray([t.bbox for t in tracks], dtype=np.float32)
+                iou = box_iou_matrix(det_boxes, track_boxes)
+
+                used_tracks = set()
+                for flat in np.argsort(-iou, axis=None):
+                    d, t = np.unravel_index(flat, iou.shape)
+                    if iou[d, t] < TRACK_IOU_THRESHOLD:
+                        break
+                    if assigned[d] is not None or t in used_tracks:
+                        continue
+                    assigned[d] = tracks[t]
+                    used_tracks.add(t)
+
+                # Fast movement can drop IoU - fall back to centroid distance
+                det_centers = (det_boxes[:, :2] + det_boxes[:, 2:]) / 2.0
+                track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+                diagonals = np.linalg.norm(det_boxes[:, 2:] - det_boxes[:, :2], axis=1)
+                for d in range(len(boxes)):
+                    if assigned[d] is not None:
+                        continue
+                    shifts = np.linalg.norm(track_centers - det_centers[d], axis=1)
+                    shifts = shifts / max(float(diagonals[d]), 1e-6)
+                    for t in np.argsort(shifts):
+                        if shifts[t] > TRACK_MAX_CENTROID_SHIFT:
+                            break
+                        if t not in used_tracks:
+                            assigned[d] = tracks[t]
+                            used_tracks.add(t)
+                            break
+
+            for d, box in enumerate(boxes):
+                track = assigned[d]
+                if track is None:
+                    track = FaceTrack(self._next_id, box, scores[d], now)
+                    self._tracks[track.track_id] = track
+                    self._next_id += 1
+                    self.tracks_created += 1
+                    assigned[d] = track
+                else:
+                    track.bbox = tuple(box)
+                    track.det_score = scores[d]
+                    track.last_seen = now
+                    track.hits += 1
+                    track.missed = 0
+
+            matched = {id(track) for track in assigned}
+            for track_id, track in list(self._tracks.items()):
+                if id(track) in matched:
+                    continue
+                track.missed += 1
+                if track.missed > TRACK_MAX_MISSED_FRAMES:
+                    del self._tracks[track_id]
+
+            return assigned
+
+    def active_tracks(self):
+        with self._lock:
+            return list(self._tracks.values())
+
+    def reset(self):
+        with self._lock:
+            self._tracks.clear()
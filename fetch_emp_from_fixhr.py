@@ -589,6 +589,7 @@ from database import (
     employee_exists,
     update_employee,
     insert_employee,
+    employee_directory,
     IMAGE_DIR,
     DATA_DIR,
 )
@@ -641,6 +642,8 @@ def fetch_and_store_employees(token):
 
         time.sleep(0.1)
 
+    employee_directory.refresh()
+
 
 def download_employee_image(emp_code, image_url):
     if not image_url or not image_url.strip():
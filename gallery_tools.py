@@ -0,0 +1,229 @@
+import os
+import json
+import argparse
+import numpy as np
+
+# ---------------------- Calibration Settings ----------------------
+CALIBRATION_QUANTILE = 0.999  # impostor similarity quantile an employee must clear
+CALIBRATION_MARGIN = 0.05  # added on top of the impostor quantile
+CALIBRATION_MAX_THRESHOLD = 0.65  # never demand more than this similarity
+
+# ---------------------- Audit Settings ----------------------
+AUDIT_THRESHOLD = 0.6  # report employee pairs at least this similar
+AUDIT_DUPLICATE_THRESHOLD = 0.9  # above this the photos are most likely the same person
+AUDIT_BLOCK_SIZE = 4096  # tile edge: one tile is AUDIT_BLOCK_SIZE^2 float32 (64 MB)
+
+
+# ---------------------- Gallery Loading ----------------------
+def load_gallery():
+    """
+    Load the gallery vectors and their employee codes, from the persisted
+    index when available (no model needed), otherwise by building the index.
+    Returns: (snapshot, gallery_checksum)
+    """
+    from recognition import (
+        DATA_DIR,
+        INDEX_STATE_NAME,
+        MODEL_NAME,
+        compute_gallery_checksum,
+        ensure_model_and_index_ready,
+        get_active_snapshot,
+        scan_profile_images,
+    )
+    from face_index import load_index_files
+
+    snapshot, manifest = load_index_files(DATA_DIR, INDEX_STATE_NAME)
+    checksum = compute_gallery_checksum(scan_profile_images())
+    if (
+        snapshot is None
+        or manifest.get("model_name") != MODEL_NAME
+        or manifest.get("gallery_checksum") != checksum
+    ):
+        print("[INFO] Persisted index missing or outdated, building the face index...")
+        ensure_model_and_index_ready()
+        snapshot = get_active_snapshot()
+
+    return snapshot, checksum
+
+
+# ---------------------- Threshold Calibration ----------------------
+def calibrate_thresholds(
+    vectors,
+    identities,
+    floor,
+    quantile=CALIBRATION_QUANTILE,
+    margin=CALIBRATION_MARGIN,
+    ceiling=CALIBRATION_MAX_THRESHOLD,
+):
+    """
+    Per-employee acceptance thresholds from the gallery impostor distribution.
+
+    One (N, N) self-similarity matrix gives, for every employee, the
+    similarities of their templates to everyone else's templates; the
+    threshold is that distribution's quantile plus a margin, clipped to
+    [floor, ceiling] so calibration only ever tightens the global threshold.
+    Returns: (thresholds dict, per-employee impostor stats dict)
+    """
+    labels, inverse = np.unique(np.asarray(identities), return_inverse=True)
+    if len(labels) < 2:
+        return {}, {}
+
+    similarity = vectors @ vectors.T
+    thresholds = {}
+    stats = {}
+    for label_idx, emp_code in enumerate(labels):
+        own = inverse == label_idx
+        impostor = similarity[own][:, ~own].ravel()
+        value = float(np.quantile(impostor, quantile)) + margin
+        thresholds[str(emp_code)] = round(float(np.clip(value, floor, ceiling)), 4)
+        stats[str(emp_code)] = {
+            "templates": int(own.sum()),
+            "impostor_max": round(float(impostor.max()), 4),
+            "impostor_mean": round(float(impostor.mean()), 4),
+        }
+    return thresholds, stats
+
+
+def run_calibration(quantile, margin, output_path=None):
+    """Calibrate thresholds for the current gallery and write the thresholds file"""
+    from recognition import MODEL_NAME, THRESHOLD, THRESHOLDS_PATH
+
+    output_path = output_path or THRESHOLDS_PATH
+    snapshot, checksum = load_gallery()
+    print(f"[INFO] Gallery: {len(snapshot)} templates, {snapshot.identity_count} employees")
+
+    thresholds, stats = calibrate_thresholds(
+        np.asarray(snapshot.vectors, dtype=np.float32),
+        snapshot.identities,
+        THRESHOLD,
+        quantile=quantile,
+        margin=margin,
+    )
+    if not thresholds:
+        print("[WARNING] Need at least two employees to calibrate thresholds")
+        return None
+
+    raised = {code: t for code, t in thresholds.items() if t > THRESHOLD}
+    for code in sorted(raised, key=raised.get, reverse=True):
+        print(
+            f"  {code:>12}: threshold {raised[code]:.4f} "
+            f"(impostor max {stats[code]['impostor_max']:.4f})"
+        )
+    print(
+        f"[INFO] {len(raised)} of {len(thresholds)} employees need more than "
+        f"the global threshold {THRESHOLD}"
+    )
+
+    data = {
+        "model_name": MODEL_NAME,
+        "gallery_checksum": checksum,
+        "quantile": quantile,
+        "margin": margin,
+        "global_threshold": THRESHOLD,
+        "thresholds": thresholds,
+    }
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, output_path)
+    print(f"[INFO] Thresholds written to {output_path}")
+    return thresholds
+
+
+# ---------------------- Gallery Audit ----------------------
+def find_similar_pairs(vectors, identities, threshold, block_size=AUDIT_BLOCK_SIZE):
+    """
+    Find templates of different employees that are at least threshold similar.
+
+    The upper triangle of the similarity matrix is computed tile by tile, so
+    memory stays at block_size^2 however large the gallery is.
+    Returns: {(identity_a, identity_b): (similarity, row_a, row_b)} keeping the
+    most similar template pair of each employee pair
+    """
+    labels, inverse = np.unique(np.asarray(identities), return_inverse=True)
+    n = len(vectors)
+    best = {}
+
+    for start_i in range(0, n, block_size):
+        block_i = np.asarray(vectors[start_i : start_i + block_size], dtype=np.float32)
+        for start_j in range(start_i, n, block_size):
+            block_j = np.asarray(vectors[start_j : start_j + block_size], dtype=np.float32)
+            tile = block_i @ block_j.T
+
+            rows, cols = np.nonzero(tile >= threshold)
+            rows_global = rows + start_i
+            cols_global = cols + start_j
+            keep = (cols_global > rows_global) & (
+                inverse[rows_global] != inverse[cols_global]
+            )
+
+            for sim, a, b in zip(
+                tile[rows[keep], cols[keep]].tolist(),
+                rows_global[keep].tolist(),
+                cols_global[keep].tolist(),
+            ):
+                code_a, code_b = str(labels[inverse[a]]), str(labels[inverse[b]])
+                if code_b < code_a:
+                    code_a, code_b, a, b = code_b, code_a, b, a
+                key = (code_a, code_b)
+                if key not in best or sim > best[key][0]:
+                    best[key] = (sim, a, b)
+
+    return best
+
+
+def run_audit(threshold, block_size, limit=None):
+    """Report employee pairs whose enrolled templates are near-duplicates or look-alikes"""
+    from database import employee_directory
+
+    snapshot, _ = load_gallery()
+    print(f"[INFO] Auditing {len(snapshot)} templates, {snapshot.identity_count} employees")
+
+    pairs = find_similar_pairs(snapshot.vectors, snapshot.identities, threshold, block_size)
+    ranked = sorted(pairs.items(), key=lambda item: item[1][0], reverse=True)
+    codes = snapshot.codes
+
+    def describe(emp_code):
+        emp = employee_directory.get_by_code(emp_code)
+        return f"{emp_code} ({emp['emp_full_name']})" if emp else emp_code
+
+    for (code_a, code_b), (sim, row_a, row_b) in ranked[:limit]:
+        kind = "DUPLICATE" if sim >= AUDIT_DUPLICATE_THRESHOLD else "look-alike"
+        print(
+            f"  {sim:.4f} {kind:>10}: {describe(code_a)} <-> {describe(code_b)} "
+            f"[{codes[row_a]} / {codes[row_b]}]"
+        )
+
+    print(f"[INFO] {len(ranked)} employee pair(s) at or above similarity {threshold}")
+    return ranked
+
+
+# ---------------------- Entry Point ----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Face gallery maintenance tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate", help="Calibrate per-employee thresholds from the gallery"
+    )
+    calibrate_parser.add_argument("--quantile", type=float, default=CALIBRATION_QUANTILE)
+    calibrate_parser.add_argument("--margin", type=float, default=CALIBRATION_MARGIN)
+    calibrate_parser.add_argument("--output", default=None, help="Thresholds file path")
+
+    audit_parser = subparsers.add_parser(
+        "audit", help="Find near-duplicate and look-alike employees in the gallery"
+    )
+    audit_parser.add_argument("--threshold", type=float, default=AUDIT_THRESHOLD)
+    audit_parser.add_argument("--block-size", type=int, default=AUDIT_BLOCK_SIZE)
+    audit_parser.add_argument("--limit", type=int, default=None, help="Pairs to print")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "calibrate":
+        run_calibration(args.quantile, args.margin, args.output)
+    elif args.command == "audit":
+        run_audit(args.threshold, args.block_size, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -146,11 +146,25 @@
 
 import os
 import cv2
-import numpy as np
-import tensorflow as tf
 import mediapipe as mp
 import sys
-from recognition import recognize_from_image, get_current_date_str, get_current_time_str
+import time
+from face_tracker import FaceTracker, appearance_thumbnail
+from liveness_runtime import create_liveness_pool
+from face_quality import assess_face_quality, describe_quality_reasons
+from spoof_cascade import (
+    get_cascade_stats,
+    inner_face,
+    make_motion_thumbnail,
+    run_spoof_cascade,
+)
+from recognition import (
+    recognize_from_image,
+    recognize_faces_from_keypoints,
+    FACE_RATIO_CROP,
+    get_current_date_str,
+    get_current_time_str,
+)
 
 
 def get_resource_path(relative_path):
@@ -164,30 +178,53 @@ def get_resource_path(relative_path):
 
 # ---------------------- Liveness Model Setup ----------------------
 
-# Load TFLite model
+# Load the liveness model on the lightest available runtime (tflite_runtime,
+# then an ONNX conversion on onnxruntime, full TensorFlow only as a last resort).
+# Checks go through a pool of sessions so concurrent threads never share an
+# interpreter, each session with its own preallocated input buffer.
 tflite_model_path = get_resource_path("liveness_model.tflite")
+onnx_model_path = get_resource_path("liveness_model.onnx")
 
-# Check if liveness model exists
-liveness_model_available = os.path.exists(tflite_model_path)
+liveness_pool = create_liveness_pool(tflite_model_path, onnx_model_path)
+liveness_runtime = liveness_pool.runtime if liveness_pool else None
+liveness_model_available = liveness_runtime is not None
 
 if liveness_model_available:
-    try:
-        interpreter = tf.lite.Interpreter(model_path=tflite_model_path)
-        interpreter.allocate_tensors()
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        print("[INFO] ✅ Liveness model loaded successfully")
-        print(f"[INFO] Model input shape: {input_details[0]['shape']}")
-        print(f"[INFO] Model output shape: {output_details[0]['shape']}")
-    except Exception as e:
-        print(f"[WARNING] Failed to load liveness model: {e}")
-        liveness_model_available = False
+    print("[INFO] ✅ Liveness model loaded successfully")
+    print(f"[INFO] Model input shape: {liveness_runtime.input_shape}")
+    print(f"[INFO] Model output shape: {liveness_runtime.output_shape}")
 else:
-    print(f"[WARNING] Liveness model not found at: {tflite_model_path}")
+    if os.path.exists(tflite_model_path) or os.path.exists(onnx_model_path):
+        print("[WARNING] Failed to load liveness model: no usable runtime installed")
+    else:
+        print(f"[WARNING] Liveness model not found at: {tflite_model_path}")
     print("[INFO] Running in face recognition only mode (liveness check disabled)")
 
 # ---------------------- MediaPipe Face Detection Setup ----------------------
 
+# Align the face for ArcFace from MediaPipe keypoints instead of running the
+# SCRFD detector again on the crop (SCRFD is still used when keypoints are poor)
+USE_KEYPOINT_ALIGNMENT = True
+
+# Follow faces across frames and reuse the identity / liveness verdict of a
+# track instead of re-running liveness, embedding and search every second
+USE_FACE_TRACKER = True
+face_tracker = FaceTracker()
+
+# Reject blurred, tiny, side-on and badly exposed faces before the liveness
+# model and embedding run (thresholds in face_quality.QUALITY_THRESHOLDS)
+USE_QUALITY_GATE = True
+
+# Vote on obvious screens, greyscale prints and frozen faces with cheap
+# FFT / colour / motion checks instead of running the liveness model; only
+# ambiguous crops reach the model
+USE_SPOOF_CASCADE = True
+
+# Gate mode: handle every face in the frame (liveness and embedding batched)
+# instead of only the most confident one
+MULTI_FACE_MODE = True
+MAX_FACES_PER_FRAME = 5
+
 # Initialize MediaPipe Face Detection
 mp_face_detection = mp.solutions.face_detection
 mp_drawing = mp.solutions.drawing_utils
@@ -206,46 +243,70 @@ except Exception as e:
 # ---------------------- Enhanced Liveness Detection Functions ----------------------
 
 
-def predict_liveness_tflite(face_img):
+LIVENESS_THRESHOLD = 0.5  # score below threshold = real face
+
+
+def run_liveness_model(face_imgs):
     """
-    Predict if face is live using TFLite model
-    Returns: True if live, False if spoofed
+    Run the liveness model on BGR face crops (resized to
+    LIVENESS_INPUT_SIZE inside a pooled session, safe to call from any thread)
+    Returns: ((N,) prediction scores, batch latency in ms)
     """
-    if not liveness_model_available:
-        print("[DEBUG] Liveness model not available, assuming face is live")
-        return True
+    return liveness_pool.predict(face_imgs)
 
-    if face_img is None or face_img.size == 0:
-        print("[DEBUG] Invalid face image for liveness detection")
-        return False
 
-    try:
-        # Preprocess face image for liveness model
-        face = cv2.resize(face_img, (224, 224))
-        face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+def get_liveness_stats():
+    """Liveness model calls and latency per batch size since startup"""
+    return liveness_pool.stats.summary() if liveness_pool else None
 
-        # Normalize pixel values to [0, 1]
-        face = face.astype("float32") / 255.0
-        face = np.expand_dims(face, axis=0)
 
-        # Run inference
-        interpreter.set_tensor(input_details[0]["index"], face)
-        interpreter.invoke()
-        output = interpreter.get_tensor(output_details[0]["index"])
+def predict_liveness_scores(face_imgs):
+    """
+    Liveness model scores for several face crops with one interpreter call
+    (groups above the largest batch bucket take one call per bucket)
+    Returns: (list of scores in input order - None where the check failed, latency_ms)
+    """
+    if not face_imgs:
+        return [], 0.0
 
-        # Interpret output (assuming binary classification: 0=real, 1=fake)
-        prediction_score = float(output[0][0])
-        is_live = prediction_score < 0.5  # Threshold for real vs fake
+    try:
+        scores, latency_ms = run_liveness_model(face_imgs)
+        print(
+            f"[DEBUG] Liveness batch of {len(face_imgs)}: "
+            f"{[round(float(s), 4) for s in scores]} in {latency_ms:.1f} ms"
+        )
+        return [float(score) for score in scores], latency_ms
+    except Exception as e:
+        print(f"[WARNING] Batch liveness failed ({e}), checking faces one by one")
 
-        print(f"[DEBUG] Liveness prediction score: {prediction_score:.4f}")
-        print(f"[DEBUG] Is live: {is_live}")
+    start = time.perf_counter()
+    scores = []
+    for face_img in face_imgs:
+        try:
+            output, _ = run_liveness_model([face_img])
+            scores.append(float(output[0]))
+        except Exception as e:
+            print(f"[ERROR] Liveness prediction failed: {e}")
+            scores.append(None)
+    return scores, (time.perf_counter() - start) * 1000.0
 
-        return is_live
 
-    except Exception as e:
-        print(f"[ERROR] Liveness prediction failed: {e}")
-        # If liveness check fails, assume face is real to avoid blocking legitimate users
-        return True
+def vote_liveness(track, score):
+    """
+    Fold one model score into the track's ring buffer
+    Returns: True (live), False (spoof) or None while the vote is undecided
+    """
+    if score is None:
+        return True  # check failed - fail open without recording a vote
+    if track is None:
+        return score < LIVENESS_THRESHOLD
+
+    verdict = track.add_liveness_score(score, LIVENESS_THRESHOLD)
+    print(
+        f"[DEBUG] Track {track.track_id} liveness votes "
+        f"{[round(s, 4) for s in track.liveness_scores]} -> {verdict}"
+    )
+    return verdict
 
 
 def enhanced_face_detection(img):
@@ -333,6 +394,201 @@ def extract_face_with_margin(img, detection, margin=0.4):
         return None, None
 
 
+def get_detection_box(img, detection):
+    """Return the MediaPipe detection box as (x1, y1, x2, y2) pixels in img"""
+    h, w = img.shape[:2]
+    box = detection.location_data.relative_bounding_box
+    x1 = box.xmin * w
+    y1 = box.ymin * h
+    return (x1, y1, x1 + box.width * w, y1 + box.height * h)
+
+
+def get_detection_score(detection):
+    return detection.score[0] if hasattr(detection, "score") and detection.score else 0.0
+
+
+def build_tracked_result(track, face_img, bbox, confidence):
+    """Result for a tracked face whose identity was already recognized"""
+    result = dict(track.identity)
+    result.update(
+        {
+            "message": f"{result.get('emp_full_name', 'Employee')} (tracked)",
+            "suppressed": True,  # nothing new was recorded for this frame
+            "tracked": True,
+            "track_id": track.track_id,
+            "face_image": face_img,
+            "face_confidence": confidence,
+            "bbox": bbox,
+        }
+    )
+    return result
+
+
+def get_detection_keypoints(img, detection):
+    """
+    Convert MediaPipe relative keypoints to pixel coordinates in img
+    Returns: list of (x, y) - right eye, left eye, nose tip, mouth center,
+    right ear tragion, left ear tragion - or None if unavailable
+    """
+    try:
+        h, w = img.shape[:2]
+        keypoints = detection.location_data.relative_keypoints
+        if not keypoints:
+            return None
+        return [(kp.x * w, kp.y * h) for kp in keypoints]
+    except Exception as e:
+        print(f"[ERROR] Keypoint extraction failed: {e}")
+        return None
+
+
+def build_face_result(recognition_result, face_img, confidence, bbox):
+    """Turn a recognition result into the detector result for one face"""
+    if recognition_result["status"]:
+        # Successful recognition and attendance processing
+        print(f"[SUCCESS] ✅ Employee recognized and attendance processed")
+        print(f"[SUCCESS] Employee: {recognition_result['emp_full_name']}")
+        print(f"[SUCCESS] Action: {recognition_result.get('attendance_action', 'N/A')}")
+        print(f"[SUCCESS] Message: {recognition_result.get('attendance_message', 'N/A')}")
+
+        return {
+            "status": True,
+            "message": recognition_result.get(
+                "detailed_message",
+                recognition_result.get("attendance_message", "Success"),
+            ),
+            "id": recognition_result.get("id"),
+            "emp_code": recognition_result.get("emp_code"),
+            "emp_b_id": recognition_result.get("emp_b_id"),
+            "emp_full_name": recognition_result.get("emp_full_name"),
+            "emp_email": recognition_result.get("emp_email", ""),
+            "similarity": recognition_result.get("similarity"),
+            "face_image": face_img,
+            "status_icon": recognition_result.get("status_icon", "✅"),
+            "attendance_action": recognition_result.get("attendance_action"),
+            "attendance_message": recognition_result.get("attendance_message"),
+            "detailed_message": recognition_result.get("detailed_message"),
+            "next_action": recognition_result.get("next_action"),
+            "current_date": recognition_result.get("current_date"),
+            "current_time": recognition_result.get("current_time"),
+            "can_checkin": recognition_result.get("can_checkin", False),
+            "can_checkout": recognition_result.get("can_checkout", False),
+            "has_checked_in": recognition_result.get("has_checked_in", False),
+            "has_checked_out": recognition_result.get("has_checked_out", False),
+            "suppressed": recognition_result.get("suppressed", False),
+            "liveness_check": True if liveness_model_available else None,
+            "liveness_available": liveness_model_available,
+            "face_confidence": confidence,
+            "bbox": bbox,
+        }
+
+    # Recognition failed or attendance issue
+    print(f"[INFO] ❌ Recognition failed or attendance issue")
+    print(f"[INFO] Reason: {recognition_result.get('message', 'Unknown')}")
+
+    return {
+        "status": False,
+        "message": recognition_result.get("message", "Person not recognized"),
+        "emp_full_name": recognition_result.get("emp_full_name", "Unknown"),
+        "similarity": recognition_result.get("similarity"),
+        "face_image": face_img,
+        "status_icon": recognition_result.get("status_icon", "🚫"),
+        "attendance_action": recognition_result.get("attendance_action"),
+        "liveness_check": True if liveness_model_available else None,
+        "liveness_available": liveness_model_available,
+        "face_confidence": confidence,
+        "bbox": bbox,
+    }
+
+
+def build_liveness_result(face_img, is_real):
+    """Result for a face whose liveness vote failed (False) or is undecided (None)"""
+    if is_real is None:
+        print("[INFO] ⏳ Liveness vote undecided - waiting for more frames")
+        return {
+            "status": False,
+            "message": "Checking liveness... please hold still.",
+            "emp_full_name": "Checking",
+            "face_image": face_img,
+            "status_icon": "⏳",
+            "liveness_check": None,
+            "liveness_available": True,
+        }
+
+    print("[WARNING] ❌ Liveness check FAILED - Potential spoofing detected")
+    return {
+        "status": False,
+        "message": "Liveness check failed. Please ensure you are a real person and try again.",
+        "emp_full_name": "Spoof Detection",
+        "face_image": face_img,
+        "status_icon": "🚫",
+        "liveness_check": False,
+        "liveness_available": True,
+    }
+
+
+def make_liveness_admit(face):
+    """
+    Admit check for a face that reused its track's cached liveness verdict:
+    the verdict only covers the employee it was confirmed for. Recognized as
+    anyone else (e.g. a photo of a colleague held up in the same spot), the
+    vote is reset and re-run on this crop before attendance is processed.
+    Returns: admit callable for recognition, or None
+    """
+    track = face["track"]
+    if track is None or not face.get("liveness_cached"):
+        return None
+
+    def admit(emp_code):
+        if track.liveness_code == emp_code:
+            return None
+        print(
+            f"[INFO] Track {track.track_id}: recognized as {emp_code} "
+            f"(liveness confirmed for {track.liveness_code}), re-checking liveness"
+        )
+        track.reset_liveness()
+        scores, _ = predict_liveness_scores([face["face_img"]])
+        is_real = vote_liveness(track, scores[0])
+        return None if is_real else build_liveness_result(face["face_img"], is_real)
+
+    return admit
+
+
+def recognize_face_batch(img, faces):
+    """
+    Embed and search all faces that passed liveness in one batch
+    Returns: one recognition result per face
+    """
+    admit_checks = (
+        [make_liveness_admit(face) for face in faces]
+        if liveness_model_available
+        else [None] * len(faces)
+    )
+    if USE_KEYPOINT_ALIGNMENT:
+        return recognize_faces_from_keypoints(
+            img,
+            [face["keypoints"] for face in faces],
+            det_scores=[face["confidence"] for face in faces],
+            fallback_imgs=[face["face_img"] for face in faces],
+            admit_checks=admit_checks,
+        )
+
+    return [
+        recognize_from_image(face["face_img"], face_ratio=FACE_RATIO_CROP, admit=admit)[0]
+        for face, admit in zip(faces, admit_checks)
+    ]
+
+
+def select_primary_result(results):
+    """Pick the result shown on the single-person card: a new punch first"""
+    for result in results:
+        if result.get("status") and not result.get("suppressed"):
+            return result
+    for result in results:
+        if result.get("status"):
+            return result
+    return results[0]
+
+
 # ---------------------- Main Detection and Recognition Function ----------------------
 
 
@@ -341,6 +597,10 @@ def detect_and_predict(img):
     Main function that combines face detection, liveness check, and face recognition
     This is the primary function called by the GUI system
 
+    In multi-face mode every detected face (up to MAX_FACES_PER_FRAME) is
+    checked, with liveness and embedding run as batches; the per-face results
+    are returned under "faces" next to the primary result.
+
     Returns: Dictionary with comprehensive results
     """
     print(f"\n[INFO] ========== STARTING DETECTION AND PREDICTION ==========")
@@ -378,6 +638,9 @@ def detect_and_predict(img):
 
     if not detections:
         print("[INFO] No faces detected")
+        if USE_FACE_TRACKER:
+            # An empty frame counts as a missed frame for every track
+            face_tracker.update([])
         return {
             "status": False,
             "message": "No face detected. Please position your face clearly in front of the camera.",
@@ -386,151 +649,226 @@ def detect_and_predict(img):
             "status_icon": "👤",
         }
 
-    # Process the first (most confident) detection
-    detection = detections[0]
-    confidence = (
-        detection.score[0] if hasattr(detection, "score") and detection.score else 0.0
-    )
-    print(f"[INFO] Processing face with confidence: {confidence:.3f}")
+    try:
+        results = process_detections(img, detections)
+    finally:
+        print(f"[INFO] ========== DETECTION AND PREDICTION COMPLETED ==========\n")
 
-    # Step 2: Extract face region
-    print("[INFO] Step 2: Extracting face region...")
-    face_img, bbox = extract_face_with_margin(img, detection, margin=0.4)
+    result = select_primary_result(results)
+    if MULTI_FACE_MODE:
+        result = dict(result)
+        result["faces"] = results
+    return result
 
-    if face_img is None:
-        print("[ERROR] Failed to extract face region")
-        return {
-            "status": False,
-            "message": "Could not extract face region. Please try again.",
-            "emp_full_name": "Extraction Error",
-            "face_image": None,
-            "status_icon": "❌",
-        }
 
-    # Step 3: Liveness Detection (if available)
-    print("[INFO] Step 3: Performing liveness check...")
-    if liveness_model_available:
-        is_real = predict_liveness_tflite(face_img)
-        if not is_real:
-            print("[WARNING] ❌ Liveness check FAILED - Potential spoofing detected")
-            return {
-                "status": False,
-                "message": "Liveness check failed. Please ensure you are a real person and try again.",
-                "emp_full_name": "Spoof Detection",
-                "face_image": face_img,
-                "status_icon": "🚫",
-                "liveness_check": False,
-                "liveness_available": True,
-            }
-        else:
-            print("[INFO] ✅ Liveness check PASSED - Real human detected")
-    else:
-        print("[INFO] ⚠️ Liveness check SKIPPED - Model not available")
+def process_detections(img, detections):
+    """
+    Run extraction, quality gate, liveness and recognition for the faces to
+    handle in this frame (the first detection only unless MULTI_FACE_MODE).
+    Returns: one result dict per processed face, in detection order
+    """
+    count = min(len(detections), MAX_FACES_PER_FRAME) if MULTI_FACE_MODE else 1
+    print(f"[INFO] Processing {count} of {len(detections)} detected face(s)")
+
+    tracks = [None] * len(detections)
+    if USE_FACE_TRACKER:
+        tracks = face_tracker.update(
+            [get_detection_box(img, d) for d in detections],
+            [get_detection_score(d) for d in detections],
+        )
 
-    # Step 4: Face Recognition and Attendance Processing
-    print("[INFO] Step 4: Performing face recognition and attendance processing...")
-    try:
-        recognition_results = recognize_from_image(face_img)
+    results = [None] * count
+    pending = []  # faces that still need liveness and recognition
 
-        if not recognition_results:
-            print("[ERROR] No recognition results returned")
-            return {
+    for i, detection in enumerate(detections[:count]):
+        confidence = get_detection_score(detection)
+        track = tracks[i]
+        print(f"[INFO] Face {i}: confidence {confidence:.3f}")
+
+        # Step 2: Extract face region
+        print("[INFO] Step 2: Extracting face region...")
+        face_img, bbox = extract_face_with_margin(img, detection, margin=0.4)
+
+        if face_img is None:
+            print("[ERROR] Failed to extract face region")
+            results[i] = {
                 "status": False,
-                "message": "Face recognition system error",
-                "emp_full_name": "System Error",
-                "face_image": face_img,
+                "message": "Could not extract face region. Please try again.",
+                "emp_full_name": "Extraction Error",
+                "face_image": None,
                 "status_icon": "❌",
             }
+            continue
+
+        det_box = get_detection_box(img, detection)
+        # Detection box inside the margin crop
+        face_box = (
+            det_box[0] - bbox[0],
+            det_box[1] - bbox[1],
+            det_box[2] - bbox[0],
+            det_box[3] - bbox[1],
+        )
 
-        # Get the first (best) recognition result
-        recognition_result = recognition_results[0]
-        print(f"[INFO] Recognition result: {recognition_result}")
-
-        if recognition_result["status"]:
-            # Successful recognition and attendance processing
-            print(f"[SUCCESS] ✅ Employee recognized and attendance processed")
-            print(f"[SUCCESS] Employee: {recognition_result['emp_full_name']}")
-            print(
-                f"[SUCCESS] Action: {recognition_result.get('attendance_action', 'N/A')}"
-            )
+        appearance = None
+        if track is not None:
+            # Cached verdicts only carry over while the box still holds the
+            # same face (compared without the margin - the kiosk background
+            # is the same for everyone)
+            appearance = appearance_thumbnail(inner_face(face_img, face_box))
+            track.check_appearance(appearance)
+            if USE_SPOOF_CASCADE:
+                # Every frame, so the motion check has history before the vote closes
+                track.thumbnails.append(make_motion_thumbnail(face_img))
+
+        if track is not None and not track.needs_recognition():
             print(
-                f"[SUCCESS] Message: {recognition_result.get('attendance_message', 'N/A')}"
+                f"[INFO] Track {track.track_id}: reusing identity {track.identity.get('emp_full_name')}"
             )
-
-            # Enhance the result with additional information
-            enhanced_result = {
-                "status": True,
-                "message": recognition_result.get(
-                    "detailed_message",
-                    recognition_result.get("attendance_message", "Success"),
-                ),
-                "id": recognition_result.get("id"),
-                "emp_code": recognition_result.get("emp_code"),
-                "emp_b_id": recognition_result.get("emp_b_id"),
-                "emp_full_name": recognition_result.get("emp_full_name"),
-                "emp_email": recognition_result.get("emp_email", ""),
-                "similarity": recognition_result.get("similarity"),
-                "face_image": face_img,
-                "status_icon": recognition_result.get("status_icon", "✅"),
-                "attendance_action": recognition_result.get("attendance_action"),
-                "attendance_message": recognition_result.get("attendance_message"),
-                "detailed_message": recognition_result.get("detailed_message"),
-                "next_action": recognition_result.get("next_action"),
-                "current_date": recognition_result.get("current_date"),
-                "current_time": recognition_result.get("current_time"),
-                "can_checkin": recognition_result.get("can_checkin", False),
-                "can_checkout": recognition_result.get("can_checkout", False),
-                "has_checked_in": recognition_result.get("has_checked_in", False),
-                "has_checked_out": recognition_result.get("has_checked_out", False),
-                "liveness_check": True if liveness_model_available else None,
-                "liveness_available": liveness_model_available,
-                "face_confidence": confidence,
+            results[i] = build_tracked_result(track, face_img, bbox, confidence)
+            continue
+
+        keypoints = get_detection_keypoints(img, detection)
+
+        # Quality gate: skip liveness and recognition for frames that would fail anyway
+        if USE_QUALITY_GATE:
+            quality = assess_face_quality(face_img, box=det_box, keypoints=keypoints)
+            if not quality["ok"]:
+                print(f"[INFO] Face quality rejected: {quality['reasons']} {quality['scores']}")
+                results[i] = {
+                    "status": False,
+                    "message": f"Face detected - {describe_quality_reasons(quality['reasons'])}",
+                    "emp_full_name": "Low Quality",
+                    "face_image": face_img,
+                    "status_icon": "👤",
+                    "quality_reasons": quality["reasons"],
+                    "quality_scores": quality["scores"],
+                    "face_confidence": confidence,
+                    "bbox": bbox,
+                }
+                continue
+
+        pending.append(
+            {
+                "slot": i,
+                "track": track,
+                "face_img": face_img,
                 "bbox": bbox,
+                "confidence": confidence,
+                "keypoints": keypoints,
+                "appearance": appearance,
+                "face_box": face_box,
             }
+        )
 
-            return enhanced_result
-
-        else:
-            # Recognition failed or attendance issue
-            print(f"[INFO] ❌ Recognition failed or attendance issue")
-            print(f"[INFO] Reason: {recognition_result.get('message', 'Unknown')}")
+    # Step 3: Liveness Detection (if available) - one batch for all new faces
+    print("[INFO] Step 3: Performing liveness check...")
+    if liveness_model_available and pending:
+        unverified = []
+        verdicts = {}
+        for face in pending:
+            track = face["track"]
+            if track is not None and track.liveness is not None:
+                # Voted verdict is kept for the lifetime of the track (but is
+                # re-voted if the face is recognized as someone else)
+                print(f"[INFO] Liveness already decided for track {track.track_id}: {track.liveness}")
+                verdicts[face["slot"]] = track.liveness
+                face["liveness_cached"] = True
+            else:
+                unverified.append(face)
+
+        if USE_SPOOF_CASCADE:
+            ambiguous = []
+            for face in unverified:
+                track = face["track"]
+                cascade = run_spoof_cascade(
+                    face["face_img"],
+                    track.thumbnails if track is not None else None,
+                    face_box=face["face_box"],
+                )
+                # Stands in for the model only on tracks it has not scored yet;
+                # untracked faces always go to the model
+                if track is None or not track.add_cascade_verdict(cascade["verdict"]):
+                    ambiguous.append(face)
+                    continue
+                print(
+                    f"[INFO] Spoof cascade: {cascade['verdict']} at stage '{cascade['stage']}' "
+                    f"for track {track.track_id} -> {track.liveness}"
+                )
+                verdicts[face["slot"]] = track.liveness
+            unverified = ambiguous
+
+        scores, latency_ms = predict_liveness_scores([face["face_img"] for face in unverified])
+        if unverified:
+            print(f"[INFO] Liveness for {len(unverified)} face(s) took {latency_ms:.1f} ms")
+        for face, score in zip(unverified, scores):
+            verdicts[face["slot"]] = vote_liveness(face["track"], score)
+
+        for face in pending:
+            is_real = verdicts[face["slot"]]
+            if is_real:
+                print("[INFO] ✅ Liveness check PASSED - Real human detected")
+            else:
+                results[face["slot"]] = build_liveness_result(face["face_img"], is_real)
+
+        pending = [face for face in pending if results[face["slot"]] is None]
+    elif not liveness_model_available:
+        print("[INFO] ⚠️ Liveness check SKIPPED - Model not available")
 
-            return {
-                "status": False,
-                "message": recognition_result.get("message", "Person not recognized"),
-                "emp_full_name": recognition_result.get("emp_full_name", "Unknown"),
-                "similarity": recognition_result.get("similarity"),
-                "face_image": face_img,
-                "status_icon": recognition_result.get("status_icon", "🚫"),
-                "attendance_action": recognition_result.get("attendance_action"),
-                "liveness_check": True if liveness_model_available else None,
-                "liveness_available": liveness_model_available,
-                "face_confidence": confidence,
-                "bbox": bbox,
-            }
+    if not pending:
+        return results
 
+    # Step 4: Face Recognition and Attendance Processing - one batch
+    print("[INFO] Step 4: Performing face recognition and attendance processing...")
+    try:
+        recognition_results = recognize_face_batch(img, pending)
     except ImportError as e:
         print(f"[ERROR] Recognition module import failed: {e}")
-        return {
-            "status": False,
-            "message": "Face recognition module not available. Please check system configuration.",
-            "emp_full_name": "Module Error",
-            "face_image": face_img,
-            "status_icon": "❌",
-        }
-
+        recognition_results = [
+            {
+                "status": False,
+                "message": "Face recognition module not available. Please check system configuration.",
+                "emp_full_name": "Module Error",
+                "status_icon": "❌",
+            }
+        ] * len(pending)
     except Exception as e:
         print(f"[ERROR] Recognition processing failed: {e}")
-        return {
-            "status": False,
-            "message": f"Recognition system error: {str(e)}",
-            "emp_full_name": "System Error",
-            "face_image": face_img,
-            "status_icon": "❌",
-        }
+        recognition_results = [
+            {
+                "status": False,
+                "message": f"Recognition system error: {str(e)}",
+                "emp_full_name": "System Error",
+                "status_icon": "❌",
+            }
+        ] * len(pending)
 
-    finally:
-        print(f"[INFO] ========== DETECTION AND PREDICTION COMPLETED ==========\n")
+    for face, recognition_result in zip(pending, recognition_results):
+        if not recognition_result:
+            print("[ERROR] No recognition results returned")
+            recognition_result = {
+                "status": False,
+                "message": "Face recognition system error",
+                "emp_full_name": "System Error",
+                "status_icon": "❌",
+            }
+        print(f"[INFO] Recognition result: {recognition_result}")
+
+        result = build_face_result(
+            recognition_result, face["face_img"], face["confidence"], face["bbox"]
+        )
+        track = face["track"]
+        if track is not None:
+            if result["status"]:
+                result["track_id"] = track.track_id
+                track.set_identity(
+                    {k: v for k, v in result.items() if k != "face_image"},
+                    appearance=face["appearance"],
+                )
+            else:
+                track.clear_identity()
+        results[face["slot"]] = result
+
+    return results
 
 
 # ---------------------- Additional Utility Functions ----------------------
@@ -553,7 +891,7 @@ def validate_system_components():
     # Check Liveness Model
     if liveness_model_available:
         print("✅ Liveness model: Available")
-        print(f"   Model path: {tflite_model_path}")
+        print(f"   Model path: {liveness_runtime.model_path}")
     else:
         issues.append("Liveness model not available (running in recognition-only mode)")
         print("⚠️ Liveness model: Not available")
@@ -567,12 +905,11 @@ def validate_system_components():
         issues.append(f"Face recognition module not available: {e}")
         print("❌ Face recognition module: Not available")
 
-    # Check TensorFlow
-    try:
-        print(f"✅ TensorFlow version: {tf.__version__}")
-    except:
-        issues.append("TensorFlow not available")
-        print("❌ TensorFlow: Not available")
+    # Check Liveness Runtime
+    if liveness_runtime is not None:
+        print(f"✅ Liveness runtime: {liveness_runtime.name} {liveness_runtime.version}")
+    else:
+        print("⚠️ Liveness runtime: None (install tflite-runtime or onnxruntime)")
 
     # Check OpenCV
     try:
@@ -601,10 +938,12 @@ def get_system_capabilities():
         "face_detection": face_detection is not None,
         "liveness_detection": liveness_model_available,
         "face_recognition": True,  # Always assume available since we import it
-        "tensorflow_available": True,
+        "liveness_runtime": liveness_runtime.name if liveness_runtime else None,
+        "liveness_stats": get_liveness_stats(),
+        "spoof_cascade": get_cascade_stats() if USE_SPOOF_CASCADE else None,
         "opencv_available": True,
         "mediapipe_available": face_detection is not None,
-        "liveness_model_path": tflite_model_path if liveness_model_available else None,
+        "liveness_model_path": liveness_runtime.model_path if liveness_model_available else None,
     }
 
 
@@ -0,0 +1,323 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+# ---------------------- Runtime Selection ----------------------
+# Tried in this order when LIVENESS_BACKEND is "auto". Full TensorFlow is the
+# last resort: importing it costs seconds and hundreds of MB per process.
+# An ONNX model for onnxruntime (already shipped for InsightFace) is made with:
+#   python -m tf2onnx.convert --tflite liveness_model.tflite --output liveness_model.onnx
+LIVENESS_BACKEND_ORDER = ("tflite_runtime", "onnxruntime", "tensorflow")
+LIVENESS_BACKEND = "auto"
+
+LIVENESS_INPUT_SIZE = 224
+# Interpreters are not thread-safe: each concurrent check gets its own session
+LIVENESS_POOL_SIZE = 2
+# Multi-face batches are padded up to the next bucket; a TFLite session keeps
+# one interpreter allocated per bucket, so alternating batch sizes never
+# reallocate tensors. Larger groups are split into chunks of the largest bucket
+LIVENESS_BATCH_BUCKETS = (1, 2, 4, 8)
+
+
+# ---------------------- Runtimes ----------------------
+class TFLiteLivenessRuntime:
+    """
+    TFLite interpreters from tflite_runtime or tensorflow.lite - one per batch
+    size, each resized and allocated once
+    """
+
+    def __init__(self, name, version, interpreter_cls, model_path):
+        self.name = name
+        self.version = version
+        self.model_path = model_path
+        self._interpreter_cls = interpreter_cls
+        self.interpreter = interpreter_cls(model_path=model_path)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self._interpreters = {self.input_shape[0]: self.interpreter}
+
+    @property
+    def input_shape(self):
+        return tuple(self.interpreter.get_input_details()[0]["shape"])
+
+    @property
+    def output_shape(self):
+        return tuple(self.interpreter.get_output_details()[0]["shape"])
+
+    def interpreter_for(self, shape):
+        """Interpreter allocated for input shape (N, H, W, 3), created on first use of N"""
+        interpreter = self._interpreters.get(shape[0])
+        if interpreter is None:
+            interpreter = self._interpreter_cls(model_path=self.model_path)
+            interpreter.resize_tensor_input(self.input_index, list(shape))
+            interpreter.allocate_tensors()
+            self._interpreters[shape[0]] = interpreter
+        return interpreter
+
+    def run(self, batch):
+        """Run a float32 (N, H, W, 3) batch on the interpreter allocated for N"""
+        interpreter = self.interpreter_for(batch.shape)
+        interpreter.set_tensor(self.input_index, batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(self.output_index)
+
+
+class ONNXLivenessRuntime:
+    """ONNX-converted liveness model on onnxruntime (CPU)"""
+
+    name = "onnxruntime"
+
+    def __init__(self, model_path):
+        import onnxruntime as ort
+
+        self.version = ort.__version__
+        self.model_path = model_path
+        self.session = ort.InferenceSession(
+            model_path, providers=["CPUExecutionProvider"]
+        )
+        self._input = self.session.get_inputs()[0]
+        self._output = self.session.get_outputs()[0]
+
+    @property
+    def input_shape(self):
+        return tuple(self._input.shape)
+
+    @property
+    def output_shape(self):
+        return tuple(self._output.shape)
+
+    def run(self, batch):
+        """Run a float32 (N, H, W, 3) batch"""
+        return self.session.run([self._output.name], {self._input.name: batch})[0]
+
+
+def _load_tflite_runtime(tflite_path, onnx_path):
+    import tflite_runtime
+    from tflite_runtime.interpreter import Interpreter
+
+    return TFLiteLivenessRuntime(
+        "tflite_runtime", getattr(tflite_runtime, "__version__", "?"), Interpreter, tflite_path
+    )
+
+
+def _load_onnxruntime(tflite_path, onnx_path):
+    return ONNXLivenessRuntime(onnx_path)
+
+
+def _load_tensorflow(tflite_path, onnx_path):
+    import tensorflow as tf
+
+    return TFLiteLivenessRuntime("tensorflow", tf.__version__, tf.lite.Interpreter, tflite_path)
+
+
+_LOADERS = {
+    "tflite_runtime": (_load_tflite_runtime, "tflite"),
+    "onnxruntime": (_load_onnxruntime, "onnx"),
+    "tensorflow": (_load_tensorflow, "tflite"),
+}
+
+
+def load_liveness_runtime(tflite_path, onnx_path=None, backend=None):
+    """
+    Load the liveness model on the first backend that is installed and has a
+    model file.
+    backend: one backend name, "auto"/None for LIVENESS_BACKEND_ORDER
+    Returns: runtime (run(batch), input_shape, name, version) or None
+    """
+    backend = backend or LIVENESS_BACKEND
+    names = LIVENESS_BACKEND_ORDER if backend == "auto" else (backend,)
+    paths = {"tflite": tflite_path, "onnx": onnx_path}
+
+    for name in names:
+        if name not in _LOADERS:
+            print(f"[WARNING] Unknown liveness backend: {name}")
+            continue
+
+        loader, model_kind = _LOADERS[name]
+        model_path = paths[model_kind]
+        if not model_path or not os.path.exists(model_path):
+            continue
+
+        try:
+            runtime = loader(tflite_path, onnx_path)
+        except ImportError:
+            print(f"[DEBUG] Liveness backend {name} not installed")
+            continue
+        except Exception as e:
+            print(f"[WARNING] Liveness backend {name} failed to load {model_path}: {e}")
+            continue
+
+        print(f"[INFO] Liveness runtime: {runtime.name} {runtime.version} ({model_path})")
+        return runtime
+
+    return None
+
+
+def warm_up(runtime):
+    """Run one zero batch so the first real check does not pay for lazy setup"""
+    shape = [dim if isinstance(dim, int) and dim > 0 else 1 for dim in runtime.input_shape]
+    shape[0] = 1
+    return runtime.run(np.zeros(shape, dtype=np.float32))
+
+
+# ---------------------- Sessions and Pool ----------------------
+class LivenessSession:
+    """
+    One runtime with preallocated input buffers. Crops are resized, converted
+    to RGB and scaled straight into the buffer, so a check allocates nothing.
+    Used by one thread at a time (see LivenessPool).
+    """
+
+    def __init__(self, runtime, input_size=LIVENESS_INPUT_SIZE):
+        self.runtime = runtime
+        self.input_size = input_size
+        self._resized = np.empty((input_size, input_size, 3), dtype=np.uint8)
+        self._rgb = np.empty((input_size, input_size, 3), dtype=np.uint8)
+        self._buffers = {1: np.zeros((1, input_size, input_size, 3), dtype=np.float32)}
+
+    def input_buffer(self, batch_size):
+        """Preallocated float32 (batch_size, H, W, 3) input buffer"""
+        buffer = self._buffers.get(batch_size)
+        if buffer is None:
+            buffer = np.zeros(
+                (batch_size, self.input_size, self.input_size, 3), dtype=np.float32
+            )
+            self._buffers[batch_size] = buffer
+        return buffer
+
+    def preprocess_into(self, face_img, out):
+        """Write a BGR crop into out (H, W, 3) as RGB float32 in [0, 1]"""
+        cv2.resize(face_img, (self.input_size, self.input_size), dst=self._resized)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        np.multiply(self._rgb, np.float32(1.0 / 255.0), out=out)
+
+    def predict(self, face_imgs, buckets=LIVENESS_BATCH_BUCKETS):
+        """
+        One model call per chunk of up to max(buckets) crops, padded to the
+        next bucket size (padding rows are ignored).
+        Returns: (N,) liveness scores for the BGR crops
+        """
+        max_batch = buckets[-1]
+        scores = []
+        for start in range(0, len(face_imgs), max_batch):
+            chunk = face_imgs[start : start + max_batch]
+            batch_size = next(b for b in buckets if b >= len(chunk))
+            batch = self.input_buffer(batch_size)
+            for i, face_img in enumerate(chunk):
+                self.preprocess_into(face_img, batch[i])
+            output = self.runtime.run(batch)
+            scores.append(np.asarray(output).reshape(batch_size, -1)[: len(chunk), 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+class LivenessBatchStats:
+    """Thread-safe call counts and latency per batch size"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_size = {}  # faces -> [calls, total_ms, max_ms]
+
+    def record(self, faces, latency_ms):
+        with self._lock:
+            entry = self._by_size.setdefault(faces, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += latency_ms
+            entry[2] = max(entry[2], latency_ms)
+
+    def summary(self):
+        with self._lock:
+            by_size = {
+                faces: {
+                    "calls": calls,
+                    "mean_ms": round(total / calls, 2),
+                    "mean_ms_per_face": round(total / calls / faces, 2),
+                    "max_ms": round(worst, 2),
+                }
+                for faces, (calls, total, worst) in sorted(self._by_size.items())
+            }
+        calls = sum(entry["calls"] for entry in by_size.values())
+        faces = sum(size * entry["calls"] for size, entry in by_size.items())
+        return {"calls": calls, "faces": faces, "by_batch_size": by_size}
+
+
+class LivenessPool:
+    """
+    Up to `size` sessions shared by worker threads. A thread checks a session
+    out for one call; more sessions are created on demand, and callers wait
+    when all `size` are busy.
+    """
+
+    def __init__(self, runtime, factory, size=LIVENESS_POOL_SIZE):
+        self.runtime = runtime  # first runtime - name, version, model path
+        self._factory = factory
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._idle.put(LivenessSession(runtime))
+        self._created = 1
+        self._lock = threading.Lock()
+        self.stats = LivenessBatchStats()
+
+    @contextmanager
+    def session(self):
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    session = LivenessSession(self._factory())
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                session = self._idle.get()
+
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def predict(self, face_imgs):
+        """
+        Thread-safe liveness scores for a list of BGR crops
+        Returns: ((N,) scores, latency_ms of the whole batch)
+        """
+        with self.session() as session:
+            start = time.perf_counter()
+            scores = session.predict(face_imgs)
+            latency_ms = (time.perf_counter() - start) * 1000.0
+
+        if len(face_imgs):
+            self.stats.record(len(face_imgs), latency_ms)
+        return scores, latency_ms
+
+
+def create_liveness_pool(tflite_path, onnx_path=None, backend=None, size=LIVENESS_POOL_SIZE):
+    """
+    Load the liveness model and wrap it in a session pool. Extra sessions use
+    the backend the first one was loaded with.
+    Returns: LivenessPool or None when no backend could load the model
+    """
+    runtime = load_liveness_runtime(tflite_path, onnx_path, backend)
+    if runtime is None:
+        return None
+
+    def factory():
+        extra = load_liveness_runtime(tflite_path, onnx_path, runtime.name)
+        if extra is None:
+            raise RuntimeError(f"Could not load another {runtime.name} liveness session")
+        return extra
+
+    return LivenessPool(runtime, factory, size)
@@ -61,6 +61,7 @@ from database import (
     get_employee_count,
     get_attendance_by_date,
     init_db,
+    today_attendance,
 )
 from device_info import get_device_info, is_internet_available
 from speak import speak
@@ -96,6 +97,19 @@ class FetchThread(QThread):
         except Exception as e:
             self.finished.emit(False, str(e))
 
+class IndexRebuildThread(QThread):
+    finished = pyqtSignal(bool, str)
+
+    def run(self):
+        try:
+            from recognition import force_rebuild_index
+            if force_rebuild_index():
+                self.finished.emit(True, "Ready - Faces loaded")
+            else:
+                self.finished.emit(False, "Ready - No face images")
+        except Exception as e:
+            self.finished.emit(False, f"Ready - Index rebuild failed: {e}")
+
 class LivenessLoaderThread(QThread):
     finished = pyqtSignal(bool, str, object)
 
@@ -679,6 +693,7 @@ class AttendanceApp(QWidget):
         self.liveness_detector_loaded = False
         self.detect_and_predict = None
         self.fetch_thread = None
+        self.index_rebuild_thread = None
         self.liveness_loader_thread = None
         self.detect_worker_running = False
         self._detect_worker = None
@@ -710,6 +725,9 @@ class AttendanceApp(QWidget):
         if hasattr(self, "fetch_thread") and self.fetch_thread:
             self.fetch_thread.quit()
             self.fetch_thread.wait()
+        if hasattr(self, "index_rebuild_thread") and self.index_rebuild_thread:
+            self.index_rebuild_thread.quit()
+            self.index_rebuild_thread.wait()
         if hasattr(self, "liveness_loader_thread") and self.liveness_loader_thread:
             self.liveness_loader_thread.quit()
             self.liveness_loader_thread.wait()
@@ -755,20 +773,26 @@ class AttendanceApp(QWidget):
         self.sidebar.fetch_btn.setText("Fetch Employees")
         if success:
             if self.liveness_detector_loaded and hasattr(self, "detect_and_predict"):
-                try:
-                    from recognition import force_rebuild_index
-                    rebuild_success = force_rebuild_index()
-                    if rebuild_success:
-                        print("Ready - Faces loaded")
-                    else:
-                        print("Ready - No face images")
-                except Exception:
-                    print("Ready - Index rebuild failed")
+                self.rebuild_index_async()
             QMessageBox.information(self, "Success", message)
         else:
             print("Fetch failed")
             QMessageBox.critical(self, "Error", f"Failed to fetch employees: {message}")
 
+    def rebuild_index_async(self):
+        # Recognition keeps serving the previous index snapshot until the
+        # rebuilt one is published, so the kiosk does not freeze meanwhile
+        if self.index_rebuild_thread and self.index_rebuild_thread.isRunning():
+            from recognition import request_index_sync
+            request_index_sync()
+            return
+        self.index_rebuild_thread = IndexRebuildThread()
+        self.index_rebuild_thread.finished.connect(self.on_index_rebuild_completed)
+        self.index_rebuild_thread.start()
+
+    def on_index_rebuild_completed(self, success, message):
+        print(message)
+
     def logout(self):
         reply = QMessageBox.question(
             self,
@@ -1730,19 +1754,32 @@ class AttendanceApp(QWidget):
 
     def on_detect_result(self, result):
         try:
-            if result.get("status"):
+            # Multi-face mode returns every face under "faces"
+            faces = result.get("faces") or [result]
+            punched = [f for f in faces if f.get("status") and not f.get("suppressed")]
+            recognized = [f for f in faces if f.get("status")]
+
+            if punched:
                 self.load_attendance_logs()
-                name = result.get("emp_full_name", "Employee")
-                self.employee_card.update_value(name)
+                names = [f.get("emp_full_name", "Employee") for f in punched]
+                self.employee_card.update_value(", ".join(names))
                 self.update_camera_border("recognized")
                 self.reset_camera_border_after_delay()
-                speak("Hello " + name)
+                speak("Hello " + " and ".join(names))
                 self.daily_table.scrollToTop()
+            elif recognized:
+                # Punch cooldown / tracked faces: nothing was written, so skip
+                # the table reload and greeting
+                names = [f.get("emp_full_name", "Employee") for f in recognized]
+                self.employee_card.update_value(", ".join(names))
+                self.update_camera_border("recognized")
+                self.reset_camera_border_after_delay()
             else:
                 name = result.get("emp_full_name", "Unknown")
                 self.employee_card.update_value(name)
                 msg = result.get("message", "")
-                if msg and "detect" in msg.lower():
+                # Undecided liveness vote: keep scanning, it is not a failure
+                if msg and ("detect" in msg.lower() or "checking" in msg.lower()):
                     self.update_camera_border("detecting")
                 else:
                     self.update_camera_border("failed")
@@ -1829,6 +1866,7 @@ class AttendanceApp(QWidget):
 def run_app():
     app = QApplication(sys.argv)
     init_db()
+    today_attendance.refresh()
     # Load session if available, else use default
     session = load_session() if is_logged_in() else {"name": "Guest", "role": "Employee"}
     window = AttendanceApp(session)
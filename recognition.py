@@ -618,21 +618,37 @@
 
 
 import insightface
+from insightface.app.common import Face
 import numpy as np
-import faiss
 import cv2
 import sqlite3
 import os
+import re
 import sys
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from database import (
-    process_employee_attendance,
+    record_attendance_punch,
     get_employee_attendance_status,
     get_next_attendance_action,
     normalize_date,
     normalize_time,
     get_current_date_str,
     get_current_time_str,
+    employee_directory,
+)
+from embedding_cache import EmbeddingCache
+from face_quality import get_quality_stats
+from face_index import (
+    FaceIndex,
+    FaceIndexSnapshot,
+    EMBEDDING_DIM,
+    save_index_files,
+    load_index_files,
 )
 import datetime
 
@@ -672,6 +688,8 @@ APP_DIR = get_app_dir()
 DATA_DIR = get_data_dir()
 DB_PATH = os.path.join(DATA_DIR, "employees.db")
 IMG_DIR = os.path.join(DATA_DIR, "profile_images")
+# Persisted index: face_index.json manifest + face_index-<tag>.npy/.faiss
+INDEX_STATE_NAME = "face_index"
 
 # Reduce noisy initialization logging to keep startup fast/clean
 # Use on-demand logging via print_system_status() when needed.
@@ -718,26 +736,135 @@ setup_directories()
 THRESHOLD = 0.35
 CTX_ID = -1
 IMG_SIZE = (640, 640)
+MODEL_NAME = "buffalo_l"
+
+# Open-set decision: the best employee must also beat the runner-up employee
+# by this similarity margin
+IDENTITY_MARGIN = 0.05
+# Per-employee thresholds written by `python gallery_tools.py calibrate`
+THRESHOLDS_PATH = os.path.join(DATA_DIR, "face_thresholds.json")
+
+# InsightFace heads to run on every frame. Kiosk mode only needs the SCRFD
+# detector and ArcFace; the buffalo_l landmark_3d_68, landmark_2d_106 and
+# genderage heads are not used by recognition. Set to None for the full pack.
+KIOSK_MODULES = ("detection", "recognition")
+INSIGHTFACE_MODULES = KIOSK_MODULES
+
+# Detector input sizes prepared at load time, smallest first. Each call uses
+# the smallest size at which the expected face still spans DET_MIN_FACE_PX
+# detector pixels - detection cost scales with input area.
+DET_SIZES = ((160, 160), (320, 320), (480, 480), (640, 640))
+DET_MIN_FACE_PX = 64
+# Expected face size as a fraction of the image's longer side
+FACE_RATIO_FRAME = 0.2  # kiosk camera frame
+FACE_RATIO_PHOTO = 0.25  # downloaded profile photo (<= 1024px)
+FACE_RATIO_CROP = 0.55  # liveness crop with 40% margin around the face
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif")
+# Additional templates of an employee: EMP001_1.jpg, EMP001_2.jpg, ...
+TEMPLATE_NAME_PATTERN = re.compile(r"^(?P<code>.+)_(?P<number>\d+)$")
 
 # ---------------------- Enhanced Model Loading with Error Handling ----------------------
 
 
-_model_instance = None
+_model_instances = {}
 
 
-def load_insightface_model():
-    """Load InsightFace model with error handling (lazy singleton)."""
-    global _model_instance
-    if _model_instance is not None:
-        return _model_instance
-    try:
-        instance = insightface.app.FaceAnalysis(name="buffalo_l")
-        instance.prepare(ctx_id=CTX_ID, det_size=IMG_SIZE)
-        _model_instance = instance
-        return _model_instance
-    except Exception as e:
-        # Do not spam stdout; let caller decide how to handle
-        raise
+def load_insightface_model(modules=INSIGHTFACE_MODULES):
+    """
+    Load InsightFace model with error handling (lazy singleton per module set).
+    modules: InsightFace task names to load, or None for every head in the pack.
+    """
+    key = tuple(sorted(modules)) if modules is not None else None
+    if key in _model_instances:
+        return _model_instances[key]
+    # An IndexRebuildThread and the first detection can both get here at
+    # startup - create each model once, under the index readiness lock
+    with _index_write_lock:
+        if key in _model_instances:
+            return _model_instances[key]
+        try:
+            instance = insightface.app.FaceAnalysis(
+                name=MODEL_NAME,
+                allowed_modules=list(key) if key is not None else None,
+            )
+            instance.prepare(ctx_id=CTX_ID, det_size=IMG_SIZE)
+            prepare_detector_sizes(instance)
+            _model_instances[key] = instance
+            return instance
+        except Exception as e:
+            # Do not spam stdout; let caller decide how to handle
+            raise
+
+
+_available_det_sizes = list(DET_SIZES)
+
+
+def prepare_detector_sizes(instance):
+    """Warm up the detector at every DET_SIZES entry; drop sizes it rejects"""
+    global _available_det_sizes
+    available = []
+    for det_size in DET_SIZES:
+        try:
+            blank = np.zeros((det_size[1], det_size[0], 3), dtype=np.uint8)
+            instance.det_model.detect(blank, input_size=det_size)
+            available.append(det_size)
+        except Exception as e:
+            print(f"[WARNING] Detector input size {det_size} unavailable: {e}")
+    _available_det_sizes = available or [IMG_SIZE]
+
+
+def get_detector_config():
+    """Detector sizes a profile photo is tried at - keys cached "no face" results"""
+    return ",".join(f"{w}x{h}" for w, h in _available_det_sizes)
+
+
+def choose_det_size(image_shape, face_ratio=FACE_RATIO_FRAME):
+    """Pick the smallest prepared detector input size for the expected face size"""
+    h, w = image_shape[:2]
+    for det_size in _available_det_sizes:
+        scale = min(det_size[0] / w, det_size[1] / h)
+        if face_ratio * max(h, w) * scale >= DET_MIN_FACE_PX:
+            return det_size
+    return _available_det_sizes[-1]
+
+
+def analyze_faces(img, face_ratio=FACE_RATIO_FRAME, max_num=0, det_size=None, analysis_model=None):
+    """
+    Same as FaceAnalysis.get() but with the detector input size chosen per call
+    from the image size and the expected face size (or given as det_size).
+    analysis_model: FaceAnalysis to run (defaults to the live model)
+    """
+    analysis_model = analysis_model or model
+    det_size = det_size or choose_det_size(img.shape, face_ratio)
+    bboxes, kpss = analysis_model.det_model.detect(
+        img, input_size=det_size, max_num=max_num, metric="default"
+    )
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(
+            bbox=bboxes[i, 0:4],
+            kps=kpss[i] if kpss is not None else None,
+            det_score=bboxes[i, 4],
+        )
+        for taskname, head in analysis_model.models.items():
+            if taskname == "detection":
+                continue
+            head.get(img, face)
+        faces.append(face)
+    return faces
+
+
+def load_analysis_model(*extra_modules):
+    """
+    Load a model with extra heads on demand, e.g. load_analysis_model("genderage")
+    or load_analysis_model() for the full pack. The live recognition model is
+    not affected.
+    """
+    if not extra_modules:
+        return load_insightface_model(modules=None)
+    return load_insightface_model(
+        modules=tuple(KIOSK_MODULES) + tuple(extra_modules)
+    )
 
 
 # Model will be loaded on first use to avoid heavy import-time cost
@@ -763,15 +890,9 @@ def get_db_connection():
 
 
 def get_employee_by_code(emp_code):
-    """Get employee details by employee code"""
+    """Get employee details by employee code (served from the in-memory directory)"""
     try:
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM employees WHERE emp_code = ?", (emp_code,))
-        emp = cursor.fetchone()
-        conn.close()
-        return dict(emp) if emp else None
+        return employee_directory.get_by_code(emp_code)
     except Exception as e:
         print(f"[ERROR] Failed to get employee {emp_code}: {e}")
         return None
@@ -785,174 +906,468 @@ def normalize(emb):
     return emb / np.linalg.norm(emb)
 
 
+def normalize_rows(embs):
+    """Normalize every row of an (N, D) embedding matrix in one step"""
+    embs = np.asarray(embs, dtype=np.float32)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs / np.maximum(norms, 1e-12)
+
+
 # ---------------------- Enhanced Face Encoding with Comprehensive Debugging ----------------------
 
 
-def comprehensive_image_directory_check():
-    """Perform comprehensive check of image directory and files"""
-    print("\n" + "=" * 60)
-    print("COMPREHENSIVE IMAGE DIRECTORY ANALYSIS")
-    print("=" * 60)
+_embedding_cache = None
+
+# Gallery build: images are decoded and encoded on a pool of worker threads
+# (OpenCV and ONNX Runtime release the GIL while they work). The workers share
+# a model whose ONNX Runtime sessions run single-threaded - default sessions
+# each start an intra-op pool the size of the machine, so N workers would run
+# cores x cores threads.
+GALLERY_BUILD_WORKERS = max(1, os.cpu_count() or 1)
+GALLERY_BUILD_INTRA_OP_THREADS = 1
+GALLERY_PROGRESS_EVERY = 25  # progress line / cache flush every N encoded images
+
+
+def get_embedding_cache():
+    """Get the on-disk embedding cache for the current model (lazy singleton)"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(MODEL_NAME)
+    return _embedding_cache
+
+
+def load_gallery_build_model():
+    """
+    Detection + recognition model for the gallery worker pool, with its ONNX
+    Runtime sessions re-created at GALLERY_BUILD_INTRA_OP_THREADS threads
+    (insightface 0.7 does not pass session options through). Not cached -
+    it only lives for one build.
+    """
+    import onnxruntime
+
+    instance = insightface.app.FaceAnalysis(
+        name=MODEL_NAME, allowed_modules=list(KIOSK_MODULES)
+    )
+    instance.prepare(ctx_id=CTX_ID, det_size=IMG_SIZE)
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = GALLERY_BUILD_INTRA_OP_THREADS
+    options.inter_op_num_threads = 1
+    for head in instance.models.values():
+        head.session = onnxruntime.InferenceSession(
+            head.model_file, sess_options=options, providers=head.session.get_providers()
+        )
+    return instance
 
-    print(f"Profile images directory: {IMG_DIR}")
-    print(f"Directory exists: {os.path.exists(IMG_DIR)}")
-    print(f"Directory absolute path: {os.path.abspath(IMG_DIR)}")
 
-    if not os.path.exists(IMG_DIR):
-        print("[ERROR] Profile images directory does not exist!")
-        return False, []
+def encode_profile_image(image_path, analysis_model=None):
+    """Run the model on a profile image and return its normalized embedding (or None)"""
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError("OpenCV cannot read this image")
+
+    # Start at the size the face-ratio guess allows; a profile photo with a
+    # smaller face than FACE_RATIO_PHOTO assumes is retried at larger sizes
+    # so the employee is not silently left out of the index
+    first = choose_det_size(img.shape, FACE_RATIO_PHOTO)
+    faces = []
+    for det_size in _available_det_sizes[_available_det_sizes.index(first) :]:
+        if det_size != first:
+            print(f"  [DEBUG] Retrying {os.path.basename(image_path)} at detector size {det_size}")
+        faces = analyze_faces(img, det_size=det_size, analysis_model=analysis_model)
+        if faces:
+            break
+    if not faces:
+        return None
+
+    embedding = faces[0].embedding.astype(np.float32)
+    return normalize(embedding)
+
 
+def encode_images(image_paths):
+    """
+    Encode profile images through the embedding cache
+    Returns: dict image_path -> normalized embedding (None when no face was found).
+    Images that fail to load are left out.
+    """
+    embeddings = {}
+
+    cache = None
+    cached, pending = {}, {}
+    detector_config = get_detector_config()
     try:
-        all_files = os.listdir(IMG_DIR)
-        # Keep this lightweight
-        # print(f"Total files in directory: {len(all_files)}")
-
-        supported_extensions = (".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif")
-        image_files = [f for f in all_files if f.lower().endswith(supported_extensions)]
-        print(f"Image files found: {len(image_files)}")
-        # print(f"Image files: {image_files}")
-
-        if not image_files:
-            print("[WARNING] No supported image files found!")
-            print(f"[INFO] Supported formats: {', '.join(supported_extensions)}")
-            print(f"[INFO] Please add employee profile images to: {IMG_DIR}")
-            return False, []
-
-        valid_images = []
-        for img_file in image_files:
-            image_path = os.path.join(IMG_DIR, img_file)
-            file_size = os.path.getsize(image_path)
-            print(f"  {img_file}: {file_size} bytes")
-
-            if file_size == 0:
-                print(f"    [ERROR] File is empty!")
-                continue
+        cache = get_embedding_cache()
+        cached, pending = cache.resolve(image_paths, detector_config)
+        print(
+            f"[INFO] Embedding cache: {len(cached)} cached, {len(pending)} to encode"
+        )
+    except Exception as e:
+        print(f"[WARNING] Embedding cache unavailable, encoding all images: {e}")
+        cache = None
+
+    new_entries = []
 
+    def flush_cache():
+        if cache is not None and new_entries:
+            try:
+                cache.store_many(new_entries, detector_config)
+            except Exception as e:
+                print(f"[WARNING] Failed to update embedding cache: {e}")
+        new_entries.clear()
+
+    to_encode = []
+    for image_path in image_paths:
+        if image_path in cached:
+            embeddings[image_path] = cached[image_path]
+        else:
+            to_encode.append(image_path)
+
+    if not to_encode:
+        return embeddings
+
+    total = len(to_encode)
+    workers = min(GALLERY_BUILD_WORKERS, total)
+    build_model = None
+    if workers > 1:
+        try:
+            build_model = load_gallery_build_model()
+        except Exception as e:
+            # The live model's sessions are already multi-threaded
+            print(f"[WARNING] Gallery build model unavailable, encoding on one worker: {e}")
+            workers = 1
+    failures = {}
+    no_face = 0
+    start = time.perf_counter()
+    print(f"[INFO] Encoding {total} images on {workers} worker(s)")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="GalleryBuild") as pool:
+        futures = {
+            pool.submit(encode_profile_image, path, build_model): path for path in to_encode
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            image_path = futures[future]
             try:
-                img = cv2.imread(image_path)
-                if img is None:
-                    print(f"    [ERROR] OpenCV cannot read this image")
-                    continue
+                normalized_embedding = future.result()
+            except Exception as e:
+                failures[image_path] = str(e)
+                print(f"  [ERROR] Failed to process {os.path.basename(image_path)}: {e}")
+            else:
+                if normalized_embedding is None:
+                    no_face += 1
+                    print(f"  [SKIP] No face detected in {os.path.basename(image_path)}")
+                if image_path in pending:
+                    new_entries.append((pending[image_path], normalized_embedding))
+                embeddings[image_path] = normalized_embedding
+
+            if done % GALLERY_PROGRESS_EVERY == 0 or done == total:
+                # Persist progress so an interrupted enrollment resumes from here
+                flush_cache()
+                elapsed = time.perf_counter() - start
+                print(
+                    f"[INFO] Encoded {done}/{total} images "
+                    f"({done / max(elapsed, 1e-6):.1f} images/s)"
+                )
+
+    flush_cache()
+    print(
+        f"[INFO] Newly encoded {total - len(failures)} images in "
+        f"{time.perf_counter() - start:.1f}s ({no_face} without a face, "
+        f"{len(failures)} failed)"
+    )
+    for image_path, error in failures.items():
+        print(f"  [FAILED] {os.path.basename(image_path)}: {error}")
+
+    return embeddings
+
+
+# ---------------------- Face Index Management ----------------------
+
+# face_index is the mutable builder, only touched by index writers while
+# holding _index_write_lock. Recognition threads search _active_snapshot,
+# an immutable copy that is replaced with a single reference assignment.
+face_index = FaceIndex(EMBEDDING_DIM)
+_active_snapshot = FaceIndexSnapshot(dim=EMBEDDING_DIM)
+# emp_code -> (image_path, file_size, file_mtime_ns) of the image currently indexed
+_indexed_images = {}
+_index_initialized = False
+_index_write_lock = threading.RLock()
+
+_sync_state_lock = threading.Lock()
+_sync_thread = None
+_sync_pending = False
+
+
+def template_owner(template_code):
+    """
+    Employee code a profile image belongs to. Extra templates are named
+    <emp_code>_<n> (EMP001_2.jpg). A name is only split when the base code is
+    a known employee and the full name is not, so codes like EMP_12 stay whole
+    while the directory is empty or not loaded yet (see refresh_template_owners).
+    """
+    if employee_directory.get_by_code(template_code) is not None:
+        return template_code
+    match = TEMPLATE_NAME_PATTERN.match(template_code)
+    if match and employee_directory.get_by_code(match.group("code")) is not None:
+        return match.group("code")
+    return template_code
+
+
+def refresh_template_owners():
+    """
+    Recompute the employee of every indexed template against the current
+    employee directory (identities are persisted with the index and unchanged
+    images are never re-encoded). Call with _index_write_lock held.
+    Returns: number of templates that moved to another employee
+    """
+    changed = face_index.relabel(template_owner)
+    if changed:
+        print(f"[INFO] {changed} template(s) re-assigned after the employee directory changed")
+    return changed
+
+
+def scan_profile_images():
+    """
+    Return {template_code: (image_path, file_size, file_mtime_ns)} for current
+    profile images (template code = file name without extension)
+    """
+    images = {}
+    if not os.path.exists(IMG_DIR):
+        return images
 
-                # print(f"    [OK] Image shape: {img.shape}")
-                valid_images.append((img_file, image_path))
+    for img_file in os.listdir(IMG_DIR):
+        if not img_file.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image_path = os.path.join(IMG_DIR, img_file)
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            continue
+        images[os.path.splitext(img_file)[0]] = (
+            image_path,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
 
-            except Exception as e:
-                print(f"    [ERROR] Failed to read image: {e}")
-                continue
+    return images
 
-        # print(f"Valid images found: {len(valid_images)}")
-        return len(valid_images) > 0, valid_images
 
-    except Exception as e:
-        print(f"[ERROR] Failed to analyze directory: {e}")
-        return False, []
+def apply_profile_changes(target_index, indexed_images, current_images):
+    """
+    Bring target_index in line with current_images, encoding only images that
+    were added or changed since indexed_images was recorded.
+    Returns: (new indexed_images dict, counts dict)
+    """
+    counts = {"added": 0, "replaced": 0, "removed": 0}
 
+    removed_codes = [code for code in indexed_images if code not in current_images]
+    changed = {
+        code: info
+        for code, info in current_images.items()
+        if indexed_images.get(code) != info
+    }
 
-def prepare_face_encodings():
-    """Prepare face encodings from profile images"""
-    known_encodings = []
-    known_codes = []
+    for emp_code in removed_codes:
+        if target_index.remove(emp_code):
+            counts["removed"] += 1
 
-    # Lightweight log
-    print("[INFO] Building face encodings from profile images...")
+    embeddings = encode_images([info[0] for info in changed.values()]) if changed else {}
 
-    has_images, valid_images = comprehensive_image_directory_check()
+    for emp_code, info in changed.items():
+        embedding = embeddings.get(info[0])
+        if embedding is None:
+            # Unreadable image or no face - make sure a stale entry is not kept
+            if target_index.remove(emp_code):
+                counts["removed"] += 1
+            continue
 
-    if not has_images:
-        print("[INFO] No valid images found for face encoding")
-        return known_encodings, known_codes
+        if target_index.contains(emp_code):
+            target_index.replace(emp_code, embedding, template_owner(emp_code))
+            counts["replaced"] += 1
+        else:
+            target_index.add(emp_code, embedding, template_owner(emp_code))
+            counts["added"] += 1
 
-    for i, (img_file, image_path) in enumerate(valid_images, 1):
-        # print progress occasionally
-        if i % 10 == 1 or i == len(valid_images):
-            print(f"[INFO] Encoding image {i}/{len(valid_images)}: {img_file}")
+    return dict(current_images), counts
 
-        emp_code = os.path.splitext(img_file)[0]
 
-        try:
-            img = cv2.imread(image_path)
-            # print(f"  [OK] Image loaded: {img.shape}")
+def _publish_snapshot():
+    """Publish the builder's current state to recognition threads (one atomic swap)"""
+    global _active_snapshot
+    _active_snapshot = face_index.snapshot()
+    print(
+        f"[INFO] Search backend: {_active_snapshot.backend_name} "
+        f"({len(_active_snapshot)} templates, {_active_snapshot.identity_count} employees)"
+    )
+    save_index_state()
 
-            faces = model.get(img)
-            if not faces:
-                print(f"  [SKIP] No face detected in image")
-                continue
 
-            # print(f"  [OK] Found {len(faces)} face(s)")
+def compute_gallery_checksum(images):
+    """SHA-1 over the {emp_code: (path, size, mtime_ns)} image table"""
+    digest = hashlib.sha1()
+    for emp_code in sorted(images):
+        path, size, mtime_ns = images[emp_code]
+        digest.update(f"{emp_code}|{os.path.basename(path)}|{size}|{mtime_ns}\n".encode())
+    return digest.hexdigest()
+
 
-            face = faces[0]
-            # print(f"  [OK] Face bounding box: {face.bbox}")
-            # print(f"  [OK] Face confidence: {face.det_score:.3f}")
+def save_index_state():
+    """Persist the active snapshot and its image table next to employees.db"""
+    try:
+        save_index_files(
+            _active_snapshot,
+            DATA_DIR,
+            INDEX_STATE_NAME,
+            {
+                "model_name": MODEL_NAME,
+                "gallery_checksum": compute_gallery_checksum(_indexed_images),
+                "indexed_images": {
+                    code: list(info) for code, info in _indexed_images.items()
+                },
+            },
+        )
+    except Exception as e:
+        print(f"[WARNING] Failed to persist face index: {e}")
 
-            embedding = face.embedding.astype(np.float32)
-            normalized_embedding = normalize(embedding)
 
-            known_encodings.append(normalized_embedding)
-            known_codes.append(emp_code)
+def load_index_state():
+    """
+    Load the persisted index (memory-mapped) when it was built with the
+    current model, and publish it without encoding anything.
+    Returns: (loaded, up_to_date) - up_to_date is False when profile images
+    changed since it was written
+    """
+    global face_index, _indexed_images, _active_snapshot
 
-            # print(f"  [SUCCESS] Face encoded for employee: {emp_code}")
+    snapshot, manifest = load_index_files(DATA_DIR, INDEX_STATE_NAME)
+    if snapshot is None:
+        return False, False
 
-        except Exception as e:
-            print(f"  [ERROR] Failed to process {img_file}: {e}")
-            continue
+    if manifest.get("model_name") != MODEL_NAME or snapshot.dim != EMBEDDING_DIM:
+        print(
+            f"[INFO] Persisted index was built for {manifest.get('model_name')}, rebuilding"
+        )
+        return False, False
+
+    # The builder starts from the loaded backend, so the first sync only
+    # applies the changed templates to it
+    face_index = FaceIndex.from_snapshot(snapshot)
+    _indexed_images = {
+        code: tuple(info) for code, info in manifest.get("indexed_images", {}).items()
+    }
+    if refresh_template_owners():
+        _publish_snapshot()
+    else:
+        _active_snapshot = snapshot
+
+    up_to_date = compute_gallery_checksum(scan_profile_images()) == manifest.get(
+        "gallery_checksum"
+    )
+    print(
+        f"[INFO] Loaded persisted index: {len(snapshot)} templates, "
+        f"backend {snapshot.backend_name}, {'current' if up_to_date else 'needs update'}"
+    )
+    return True, up_to_date
 
-    print(f"[INFO] Encoded {len(known_encodings)} faces")
 
-    return known_encodings, known_codes
+def get_active_snapshot():
+    """Get the index snapshot recognition should search (never blocks)"""
+    return _active_snapshot
 
 
-# ---------------------- FAISS Index Management ----------------------
+def sync_face_index():
+    """Apply profile image additions, removals and changes, then publish a new snapshot"""
+    global _indexed_images
 
-face_encodings = []
-face_codes = []
-index = None
-_last_index_codes_snapshot = set()
+    with _index_write_lock:
+        try:
+            current_images = scan_profile_images()
+            new_indexed, counts = apply_profile_changes(
+                face_index, _indexed_images, current_images
+            )
+            _indexed_images = new_indexed
+            relabeled = refresh_template_owners()
 
+            if any(counts.values()) or relabeled:
+                _publish_snapshot()
+                print(
+                    f"[INFO] Index updated: +{counts['added']} ~{counts['replaced']} "
+                    f"-{counts['removed']} ({len(face_index)} templates)"
+                )
+            return len(face_index) > 0
 
-def initialize_dummy_index():
-    """Create a dummy index to prevent errors when no faces are loaded"""
-    global index, face_codes
-    print("[INFO] Creating dummy index (no employee images loaded yet)...")
-    dummy_embedding = np.random.random((1, 512)).astype("float32")
-    index = faiss.IndexFlatIP(512)
-    index.add(dummy_embedding)
-    face_codes = ["DUMMY"]
-    return True
+        except Exception as e:
+            print(f"[ERROR] Failed to update face index: {e}")
+            return False
 
 
 def rebuild_face_index():
     """Rebuild the face index from current profile images"""
-    global face_encodings, face_codes, index
+    global face_index, _indexed_images
 
     print("[INFO] Rebuilding face recognition index...")
 
-    try:
-        new_face_encodings, new_face_codes = prepare_face_encodings()
+    with _index_write_lock:
+        try:
+            new_index = FaceIndex(EMBEDDING_DIM)
+            new_indexed, _ = apply_profile_changes(
+                new_index, {}, scan_profile_images()
+            )
 
-        if not new_face_encodings:
-            print("[INFO] No face encodings found, keeping dummy index...")
-            if index is None:
-                initialize_dummy_index()
-            return False
+            face_index = new_index
+            _indexed_images = new_indexed
+            _publish_snapshot()
 
-        print(f"[INFO] Building FAISS index with {len(new_face_codes)} faces...")
-        embeddings_np = np.vstack(new_face_encodings).astype("float32")
-        new_index = faiss.IndexFlatIP(embeddings_np.shape[1])
-        new_index.add(embeddings_np)
+            try:
+                get_embedding_cache().prune(
+                    [info[0] for info in new_indexed.values()]
+                )
+            except Exception as e:
+                print(f"[WARNING] Failed to prune embedding cache: {e}")
 
-        face_encodings = new_face_encodings
-        face_codes = new_face_codes
-        index = new_index
+            if len(face_index) == 0:
+                print("[INFO] No face encodings found")
+                return False
 
-        print(f"[INFO] Index ready with {len(face_codes)} profiles")
-        return True
+            print(f"[INFO] Index ready with {len(face_index)} templates")
+            return True
 
-    except Exception as e:
-        print(f"[ERROR] Failed to rebuild face index: {e}")
-        if index is None:
-            initialize_dummy_index()
-        return False
+        except Exception as e:
+            print(f"[ERROR] Failed to rebuild face index: {e}")
+            return False
+
+
+def _background_sync_worker():
+    """Run index syncs until no further update was requested meanwhile"""
+    global _sync_thread, _sync_pending
+    while True:
+        try:
+            force_rebuild_index()
+        except Exception as e:
+            print(f"[ERROR] Background index update failed: {e}")
+
+        with _sync_state_lock:
+            if not _sync_pending:
+                _sync_thread = None
+                return
+            _sync_pending = False
+
+
+def request_index_sync():
+    """
+    Schedule an index update on a background thread and return immediately.
+    Requests made while an update is running are coalesced into one re-run.
+    Returns: True if a new worker was started
+    """
+    global _sync_thread, _sync_pending
+    with _sync_state_lock:
+        if _sync_thread is not None:
+            _sync_pending = True
+            return False
+        _sync_thread = threading.Thread(
+            target=_background_sync_worker, name="FaceIndexSync", daemon=True
+        )
+        _sync_thread.start()
+        return True
 
 
 # ---------------------- Initialize System ----------------------
@@ -960,42 +1375,53 @@ def rebuild_face_index():
 # Defer any heavy work until first call
 
 def ensure_model_and_index_ready():
-    global model, index, _last_index_codes_snapshot
+    global model, _index_initialized
     if model is None:
         model = load_insightface_model()
-    if index is None:
-        # Try real index; fallback to dummy
-        if not rebuild_face_index():
-            initialize_dummy_index()
-            _last_index_codes_snapshot = set([code for code in face_codes])
-    else:
-        # Rebuild if images changed
-        if should_rebuild_index():
-            rebuild_face_index()
-    if not _last_index_codes_snapshot:
-        _last_index_codes_snapshot = set([code for code in face_codes])
+    if not _index_initialized:
+        # Nothing to serve yet, so the first build has to complete - unless
+        # the index persisted by the last run can be memory-mapped
+        with _index_write_lock:
+            if not _index_initialized:
+                load_employee_thresholds()
+                loaded, up_to_date = load_index_state()
+                if not loaded:
+                    rebuild_face_index()
+                elif not up_to_date:
+                    sync_face_index()
+                _index_initialized = True
+    elif should_rebuild_index():
+        # Images added or removed - update in the background, keep serving
+        # from the current snapshot meanwhile
+        request_index_sync()
 
 # ---------------------- Enhanced Recognition Functions with FIXED Attendance Validation ----------------------
 
 
-def recognize_from_image(img):
-    """Recognize faces in the given image with STRICT attendance validation"""
-    results = []
-
-    if img is None:
-        return [
+def get_ready_snapshot():
+    """
+    Make sure the model and index are loaded and return the snapshot to search.
+    Returns: (snapshot, None) or (None, error results list)
+    """
+    try:
+        ensure_model_and_index_ready()
+    except Exception as e:
+        return None, [
             {
                 "status": False,
-                "emp_full_name": "Invalid image",
-                "message": "No image provided",
+                "emp_full_name": "Detection Error",
+                "message": str(e),
                 "similarity": 0.0,
                 "status_icon": "❌",
             }
         ]
 
+    # Search one snapshot for the whole call so codes always match the index
+    snapshot = get_active_snapshot()
+
     # Check if we have real faces loaded
-    if len(face_codes) == 1 and face_codes[0] == "DUMMY":
-        return [
+    if len(snapshot) == 0:
+        return None, [
             {
                 "status": False,
                 "emp_full_name": "No profiles loaded",
@@ -1005,9 +1431,348 @@ def recognize_from_image(img):
             }
         ]
 
+    return snapshot, None
+
+
+# ---------------------- Punch Cooldown ----------------------
+
+# Seconds after a recorded punch during which the same employee is not
+# punched again (a person standing at the camera is seen every second)
+PUNCH_COOLDOWN_SECONDS = 60
+
+
+class PunchCooldown:
+    """In-memory per-employee punch rate limit with suppression counters"""
+
+    def __init__(self, window_seconds=PUNCH_COOLDOWN_SECONDS):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._last_punch = {}
+        self.recorded = 0
+        self.suppressed = 0
+        self.suppressed_by_employee = {}
+
+    def try_acquire(self, emp_code):
+        """
+        Claim a punch for emp_code.
+        Returns: (allowed, seconds until the next punch is accepted)
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_punch.get(emp_code)
+            if last is not None and now - last < self.window_seconds:
+                self.suppressed += 1
+                self.suppressed_by_employee[emp_code] = (
+                    self.suppressed_by_employee.get(emp_code, 0) + 1
+                )
+                return False, self.window_seconds - (now - last)
+            self._last_punch[emp_code] = now
+            self.recorded += 1
+            return True, 0.0
+
+    def release(self, emp_code):
+        """Forget a claimed punch that was not written (e.g. database error)"""
+        with self._lock:
+            self._last_punch.pop(emp_code, None)
+            self.recorded = max(0, self.recorded - 1)
+
+    def reset(self):
+        with self._lock:
+            self._last_punch.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_seconds": self.window_seconds,
+                "recorded": self.recorded,
+                "suppressed": self.suppressed,
+                "suppressed_by_employee": dict(self.suppressed_by_employee),
+            }
+
+
+punch_cooldown = PunchCooldown()
+
+
+def get_punch_cooldown_stats():
+    """Counters for recorded vs suppressed punches"""
+    return punch_cooldown.stats()
+
+
+def build_cooldown_result(emp_details, sim, remaining):
+    """Result for a punch suppressed by the cooldown (today's status from memory only)"""
+    emp_code = emp_details["emp_code"]
+    current_date = get_current_date_str()
+    status = get_employee_attendance_status(emp_code, current_date)
+    message = f"Attendance already recorded. Next punch accepted in {int(remaining) + 1}s"
+
+    return {
+        "status": True,
+        "suppressed": True,
+        "id": emp_details["id"],
+        "emp_code": emp_code,
+        "emp_b_id": emp_details["emp_b_id"],
+        "emp_full_name": emp_details["emp_full_name"],
+        "emp_email": emp_details.get("emp_email", ""),
+        "similarity": round(sim, 4),
+        "attendance_action": "COOLDOWN",
+        "attendance_message": message,
+        "detailed_message": f"{emp_details['emp_full_name']}, {message.lower()}",
+        "status_icon": "⏳",
+        "current_date": current_date,
+        "current_time": get_current_time_str(),
+        "can_checkin": status.get("can_checkin", False),
+        "can_checkout": status.get("can_checkout", False),
+        "has_checked_in": status.get("has_checked_in", False),
+        "has_checked_out": status.get("has_checked_out", False),
+    }
+
+
+# ---------------------- Open-Set Decision ----------------------
+
+_employee_thresholds = {}
+
+
+def load_employee_thresholds():
+    """Load calibrated per-employee thresholds (never below the global THRESHOLD)"""
+    global _employee_thresholds
+    thresholds = {}
+    if os.path.exists(THRESHOLDS_PATH):
+        try:
+            with open(THRESHOLDS_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("model_name") == MODEL_NAME:
+                thresholds = {
+                    code: max(float(value), THRESHOLD)
+                    for code, value in data.get("thresholds", {}).items()
+                }
+                print(f"[INFO] Loaded {len(thresholds)} calibrated employee thresholds")
+            else:
+                print(
+                    f"[WARNING] Thresholds in {THRESHOLDS_PATH} were calibrated for "
+                    f"{data.get('model_name')}, using the global threshold"
+                )
+        except Exception as e:
+            print(f"[WARNING] Failed to load employee thresholds: {e}")
+    _employee_thresholds = thresholds
+    return thresholds
+
+
+def get_employee_threshold(emp_code):
+    return _employee_thresholds.get(emp_code, THRESHOLD)
+
+
+def match_face_embeddings(embeddings, snapshot):
+    """
+    Normalize and search all embeddings of a frame with one batched call,
+    aggregating the nearest templates per employee.
+    Returns: list of (emp_code or None, similarity, runner-up similarity or
+    None) in input order
+    """
+    queries = normalize_rows(np.vstack(embeddings))
+    matches = []
+    for ranked in snapshot.search_identities(queries):
+        if not ranked:
+            matches.append((None, 0.0, None))
+            continue
+        runner_up = float(ranked[1][1]) if len(ranked) > 1 else None
+        matches.append((ranked[0][0], float(ranked[0][1]), runner_up))
+    return matches
+
+
+def process_face_match(emp_code, sim, runner_up=None, admit=None):
+    """
+    Apply the open-set decision to a search hit - the employee's threshold
+    and the margin over the runner-up employee - and process attendance for
+    the matched employee.
+    admit: optional callable(emp_code) run before attendance; it returns None
+    to proceed or a result dict to return instead (e.g. liveness re-check)
+    Returns: result dict
+    """
+    threshold = get_employee_threshold(emp_code) if emp_code is not None else THRESHOLD
+    margin = sim - runner_up if runner_up is not None else None
+    ambiguous = margin is not None and margin < IDENTITY_MARGIN
+
+    if emp_code is not None and sim > threshold and not ambiguous:
+        emp_details = get_employee_by_code(emp_code)
+
+        if emp_details:
+            if admit is not None:
+                blocked = admit(emp_code)
+                if blocked is not None:
+                    return blocked
+
+            # Repeat punches inside the cooldown window never reach the database
+            allowed, remaining = punch_cooldown.try_acquire(emp_code)
+            if not allowed:
+                return build_cooldown_result(emp_details, sim, remaining)
+
+            # Use normalized date and time functions
+            current_date = get_current_date_str()
+            current_time = get_current_time_str()
+
+            print(
+                f"[INFO] Employee recognized: {emp_details['emp_full_name']} ({emp_code})"
+            )
+            print(f"[INFO] Similarity: {sim:.4f}")
+            print(
+                f"[INFO] Processing attendance for date: {current_date} at time: {current_time}"
+            )
+
+            # One transaction: pre status, check-in/checkout write, post status
+            attendance_result = record_attendance_punch(
+                emp_details["emp_b_id"],
+                emp_code,
+                emp_details["emp_full_name"],
+                current_date,
+                current_time,
+            )
+            if not attendance_result["success"]:
+                punch_cooldown.release(emp_code)
+            pre_attendance_status = attendance_result.get("pre_status", {})
+            post_attendance_status = attendance_result.get("post_status", {})
+
+            print(
+                f"[INFO] Pre-processing attendance status: {pre_attendance_status}"
+            )
+            print(
+                f"[INFO] Next required action: {attendance_result.get('pre_next_action')}"
+            )
+            print(f"[INFO] Attendance processing result: {attendance_result}")
+
+            # Prepare detailed response based on attendance result
+            if attendance_result["success"]:
+                if attendance_result["action"] == "CHECKED_IN":
+                    action_message = (
+                        f"✅ Successfully checked in at {current_time}"
+                    )
+                    status_icon = "🟢"
+                    detailed_message = f"Welcome {emp_details['emp_full_name']}! You have been checked in for {current_date}."
+                elif attendance_result["action"] == "CHECKED_OUT":
+                    action_message = (
+                        f"✅ Successfully checked out at {current_time}"
+                    )
+                    status_icon = "🔴"
+                    detailed_message = f"Goodbye {emp_details['emp_full_name']}! You have been checked out for {current_date}."
+                else:
+                    action_message = attendance_result["message"]
+                    status_icon = "⚠️"
+                    detailed_message = action_message
+            else:
+                if attendance_result["action"] == "ALREADY_CHECKED_IN":
+                    action_message = (
+                        f"⚠️ Already checked in today. Ready to check out."
+                    )
+                    status_icon = "🟡"
+                    detailed_message = f"{emp_details['emp_full_name']}, you are already checked in. Your next action should be CHECK OUT."
+                elif attendance_result["action"] == "ALREADY_CHECKED_OUT":
+                    action_message = (
+                        f"⚠️ Already checked out today. Attendance completed."
+                    )
+                    status_icon = "🔵"
+                    detailed_message = f"{emp_details['emp_full_name']}, you have already completed your attendance for today."
+                elif attendance_result["action"] == "ALREADY_COMPLETED":
+                    action_message = (
+                        f"⚠️ Attendance already completed for today."
+                    )
+                    status_icon = "🔵"
+                    detailed_message = f"{emp_details['emp_full_name']}, your attendance for {current_date} is already complete."
+                elif attendance_result["action"] == "NOT_CHECKED_IN":
+                    action_message = f"⚠️ Please check in first."
+                    status_icon = "❓"
+                    detailed_message = f"{emp_details['emp_full_name']}, you need to check in before you can check out."
+                else:
+                    action_message = attendance_result["message"]
+                    status_icon = "❌"
+                    detailed_message = attendance_result["message"]
+
+            next_available_action = attendance_result.get("next_action")
+
+            result = {
+                "status": attendance_result["success"],
+                "id": emp_details["id"],
+                "emp_code": emp_details["emp_code"],
+                "emp_b_id": emp_details["emp_b_id"],
+                "emp_full_name": emp_details["emp_full_name"],
+                "emp_email": emp_details.get("emp_email", ""),
+                "similarity": round(sim, 4),
+                "attendance_action": attendance_result["action"],
+                "attendance_message": action_message,
+                "detailed_message": detailed_message,
+                "status_icon": status_icon,
+                "next_action": next_available_action,
+                "current_date": current_date,
+                "current_time": current_time,
+                "attendance_details": attendance_result,
+                "pre_status": pre_attendance_status,
+                "post_status": post_attendance_status,
+                "can_checkin": post_attendance_status.get("can_checkin", False),
+                "can_checkout": post_attendance_status.get(
+                    "can_checkout", False
+                ),
+                "has_checked_in": post_attendance_status.get(
+                    "has_checked_in", False
+                ),
+                "has_checked_out": post_attendance_status.get(
+                    "has_checked_out", False
+                ),
+            }
+        else:
+            result = {
+                "status": False,
+                "emp_full_name": "Unknown employee",
+                "message": f"Employee {emp_code} not found in database",
+                "similarity": round(sim, 4),
+                "status_icon": "❓",
+            }
+    elif emp_code is not None and sim > threshold:
+        print(
+            f"[INFO] Ambiguous match {emp_code} ({sim:.4f}), runner-up {runner_up:.4f}"
+        )
+        result = {
+            "status": False,
+            "emp_full_name": "Uncertain match",
+            "message": f"Face matches more than one employee (margin: {margin:.4f}, required: {IDENTITY_MARGIN})",
+            "similarity": round(sim, 4),
+            "status_icon": "❓",
+        }
+    else:
+        result = {
+            "status": False,
+            "emp_full_name": "Unauthorized person",
+            "message": f"Face not recognized (similarity: {sim:.4f}, required: {threshold})",
+            "similarity": round(sim, 4),
+            "status_icon": "🚫",
+        }
+
+    return result
+
+
+def recognize_from_image(img, face_ratio=FACE_RATIO_FRAME, admit=None):
+    """
+    Recognize faces in the given image with STRICT attendance validation
+    face_ratio: expected face size / image longer side (use FACE_RATIO_CROP for
+    face crops) - sets the detector input size.
+    admit: see process_face_match
+    """
+    results = []
+
+    if img is None:
+        return [
+            {
+                "status": False,
+                "emp_full_name": "Invalid image",
+                "message": "No image provided",
+                "similarity": 0.0,
+                "status_icon": "❌",
+            }
+        ]
+
+    snapshot, error_results = get_ready_snapshot()
+    if error_results:
+        return error_results
+
     try:
-        ensure_model_and_index_ready()
-        faces = model.get(img)
+        faces = analyze_faces(img, face_ratio)
     except Exception as e:
         return [
             {
@@ -1030,154 +1795,24 @@ def recognize_from_image(img):
             }
         ]
 
-    for face in faces:
-        try:
-            emb = normalize(face.embedding.astype("float32")).reshape(1, -1)
-            D, I = index.search(emb, k=1)
-            sim = float(D[0][0])
-            matched_idx = int(I[0][0])
-
-            if sim > THRESHOLD:
-                emp_code = face_codes[matched_idx]
-                emp_details = get_employee_by_code(emp_code)
-
-                if emp_details:
-                    # Use normalized date and time functions
-                    current_date = get_current_date_str()
-                    current_time = get_current_time_str()
-
-                    print(
-                        f"[INFO] Employee recognized: {emp_details['emp_full_name']} ({emp_code})"
-                    )
-                    print(f"[INFO] Similarity: {sim:.4f}")
-                    print(
-                        f"[INFO] Processing attendance for date: {current_date} at time: {current_time}"
-                    )
-
-                    # Get current attendance status BEFORE processing
-                    pre_attendance_status = get_employee_attendance_status(
-                        emp_code, current_date
-                    )
-                    next_action = get_next_attendance_action(emp_code, current_date)
-
-                    print(
-                        f"[INFO] Pre-processing attendance status: {pre_attendance_status}"
-                    )
-                    print(f"[INFO] Next required action: {next_action}")
-
-                    # Process attendance using the FIXED smart function
-                    attendance_result = process_employee_attendance(
-                        emp_details["emp_b_id"],
-                        emp_code,
-                        emp_details["emp_full_name"],
-                        current_date,
-                        current_time,
-                    )
-
-                    print(f"[INFO] Attendance processing result: {attendance_result}")
-
-                    # Prepare detailed response based on attendance result
-                    if attendance_result["success"]:
-                        if attendance_result["action"] == "CHECKED_IN":
-                            action_message = (
-                                f"✅ Successfully checked in at {current_time}"
-                            )
-                            status_icon = "🟢"
-                            detailed_message = f"Welcome {emp_details['emp_full_name']}! You have been checked in for {current_date}."
-                        elif attendance_result["action"] == "CHECKED_OUT":
-                            action_message = (
-                                f"✅ Successfully checked out at {current_time}"
-                            )
-                            status_icon = "🔴"
-                            detailed_message = f"Goodbye {emp_details['emp_full_name']}! You have been checked out for {current_date}."
-                        else:
-                            action_message = attendance_result["message"]
-                            status_icon = "⚠️"
-                            detailed_message = action_message
-                    else:
-                        if attendance_result["action"] == "ALREADY_CHECKED_IN":
-                            action_message = (
-                                f"⚠️ Already checked in today. Ready to check out."
-                            )
-                            status_icon = "🟡"
-                            detailed_message = f"{emp_details['emp_full_name']}, you are already checked in. Your next action should be CHECK OUT."
-                        elif attendance_result["action"] == "ALREADY_CHECKED_OUT":
-                            action_message = (
-                                f"⚠️ Already checked out today. Attendance completed."
-                            )
-                            status_icon = "🔵"
-                            detailed_message = f"{emp_details['emp_full_name']}, you have already completed your attendance for today."
-                        elif attendance_result["action"] == "ALREADY_COMPLETED":
-                            action_message = (
-                                f"⚠️ Attendance already completed for today."
-                            )
-                            status_icon = "🔵"
-                            detailed_message = f"{emp_details['emp_full_name']}, your attendance for {current_date} is already complete."
-                        elif attendance_result["action"] == "NOT_CHECKED_IN":
-                            action_message = f"⚠️ Please check in first."
-                            status_icon = "❓"
-                            detailed_message = f"{emp_details['emp_full_name']}, you need to check in before you can check out."
-                        else:
-                            action_message = attendance_result["message"]
-                            status_icon = "❌"
-                            detailed_message = attendance_result["message"]
-
-                    # Get updated attendance status after processing
-                    post_attendance_status = get_employee_attendance_status(
-                        emp_code, current_date
-                    )
-                    next_available_action = get_next_attendance_action(
-                        emp_code, current_date
-                    )
-
-                    result = {
-                        "status": attendance_result["success"],
-                        "id": emp_details["id"],
-                        "emp_code": emp_details["emp_code"],
-                        "emp_b_id": emp_details["emp_b_id"],
-                        "emp_full_name": emp_details["emp_full_name"],
-                        "emp_email": emp_details.get("emp_email", ""),
-                        "similarity": round(sim, 4),
-                        "attendance_action": attendance_result["action"],
-                        "attendance_message": action_message,
-                        "detailed_message": detailed_message,
-                        "status_icon": status_icon,
-                        "next_action": next_available_action,
-                        "current_date": current_date,
-                        "current_time": current_time,
-                        "attendance_details": attendance_result,
-                        "pre_status": pre_attendance_status,
-                        "post_status": post_attendance_status,
-                        "can_checkin": post_attendance_status.get("can_checkin", False),
-                        "can_checkout": post_attendance_status.get(
-                            "can_checkout", False
-                        ),
-                        "has_checked_in": post_attendance_status.get(
-                            "has_checked_in", False
-                        ),
-                        "has_checked_out": post_attendance_status.get(
-                            "has_checked_out", False
-                        ),
-                    }
-                else:
-                    result = {
-                        "status": False,
-                        "emp_full_name": "Unknown employee",
-                        "message": f"Employee {emp_code} not found in database",
-                        "similarity": round(sim, 4),
-                        "status_icon": "❓",
-                    }
-            else:
-                result = {
-                    "status": False,
-                    "emp_full_name": "Unauthorized person",
-                    "message": f"Face not recognized (similarity: {sim:.4f}, required: {THRESHOLD})",
-                    "similarity": round(sim, 4),
-                    "status_icon": "🚫",
-                }
-
-            results.append(result)
+    # One search for every face in the frame, then per-face attendance
+    try:
+        matches = match_face_embeddings([face.embedding for face in faces], snapshot)
+    except Exception as e:
+        print(f"[ERROR] Face search error: {e}")
+        return [
+            {
+                "status": False,
+                "emp_full_name": "Recognition Error",
+                "message": str(e),
+                "similarity": 0.0,
+                "status_icon": "❌",
+            }
+        ]
 
+    for match in matches:
+        try:
+            results.append(process_face_match(*match, admit=admit))
         except Exception as e:
             print(f"[ERROR] Face recognition error: {e}")
             results.append(
@@ -1193,6 +1828,190 @@ def recognize_from_image(img):
     return results
 
 
+# ---------------------- Keypoint Alignment (single detection pass) ----------------------
+
+# ArcFace 112x112 reference points (insightface arcface_dst): eyes, nose and
+# mouth. MediaPipe only gives a mouth center, so the two mouth corners of the
+# template are collapsed into their midpoint.
+ARCFACE_INPUT_SIZE = 112
+ARCFACE_REFERENCE_POINTS = np.array(
+    [
+        [38.2946, 51.6963],
+        [73.5318, 51.5014],
+        [56.0252, 71.7366],
+        [56.1396, 92.2848],
+    ],
+    dtype=np.float32,
+)
+
+# Keypoints below these limits are re-detected with SCRFD instead
+KEYPOINT_MIN_SCORE = 0.75
+KEYPOINT_MIN_EYE_DISTANCE = 24  # pixels in the source image
+KEYPOINT_MAX_YAW_RATIO = 0.35  # nose offset from eye midpoint / eye distance
+KEYPOINT_MAX_RESIDUAL = 6.0  # mean alignment error in 112x112 pixels
+
+
+def _keypoints_to_source_points(keypoints):
+    """Order MediaPipe keypoints (right eye, left eye, nose tip, mouth center) like the template"""
+    points = np.asarray(keypoints, dtype=np.float32)[:4]
+    eyes = points[:2][np.argsort(points[:2, 0])]  # image-left eye first
+    return np.vstack([eyes, points[2:4]])
+
+
+def check_keypoint_quality(keypoints, det_score, image_shape):
+    """
+    Decide whether upstream detector keypoints are good enough for alignment
+    Returns: (ok, reason)
+    """
+    if keypoints is None or len(keypoints) < 4:
+        return False, "missing keypoints"
+
+    if det_score is not None and det_score < KEYPOINT_MIN_SCORE:
+        return False, f"low detection score {det_score:.2f}"
+
+    points = _keypoints_to_source_points(keypoints)
+    h, w = image_shape[:2]
+    if (
+        np.any(points[:, 0] < 0)
+        or np.any(points[:, 0] >= w)
+        or np.any(points[:, 1] < 0)
+        or np.any(points[:, 1] >= h)
+    ):
+        return False, "keypoints outside image"
+
+    left_eye, right_eye, nose, mouth = points
+    eye_distance = float(np.linalg.norm(right_eye - left_eye))
+    if eye_distance < KEYPOINT_MIN_EYE_DISTANCE:
+        return False, f"face too small (eye distance {eye_distance:.0f}px)"
+
+    eye_mid = (left_eye + right_eye) / 2.0
+    yaw_ratio = abs(float(nose[0] - eye_mid[0])) / eye_distance
+    if yaw_ratio > KEYPOINT_MAX_YAW_RATIO:
+        return False, f"head turned (yaw ratio {yaw_ratio:.2f})"
+
+    if not (eye_mid[1] < nose[1] < mouth[1]):
+        return False, "implausible keypoint geometry"
+
+    return True, "ok"
+
+
+def align_face_from_keypoints(img, keypoints):
+    """
+    Warp the face to the ArcFace 112x112 template using upstream keypoints
+    Returns: (aligned_face, mean_residual_px)
+    """
+    src = _keypoints_to_source_points(keypoints)
+    matrix, _ = cv2.estimateAffinePartial2D(
+        src, ARCFACE_REFERENCE_POINTS, method=cv2.LMEDS
+    )
+    if matrix is None:
+        raise ValueError("Could not estimate alignment transform")
+
+    projected = src @ matrix[:, :2].T + matrix[:, 2]
+    residual = float(
+        np.mean(np.linalg.norm(projected - ARCFACE_REFERENCE_POINTS, axis=1))
+    )
+
+    aligned = cv2.warpAffine(
+        img, matrix, (ARCFACE_INPUT_SIZE, ARCFACE_INPUT_SIZE), borderValue=0.0
+    )
+    return aligned, residual
+
+
+def embed_aligned_faces(aligned_faces):
+    """Run ArcFace on already aligned 112x112 BGR faces. Returns normalized (N, 512) embeddings"""
+    rec_model = model.models["recognition"]
+    feats = rec_model.get_feat(list(aligned_faces)).astype(np.float32)
+    norms = np.linalg.norm(feats, axis=1, keepdims=True)
+    return feats / np.maximum(norms, 1e-12)
+
+
+def align_for_recognition(img, keypoints, det_score=None):
+    """
+    Quality-check keypoints and align the face for ArcFace
+    Returns: (aligned_face or None, reason)
+    """
+    ok, reason = check_keypoint_quality(keypoints, det_score, img.shape)
+    if not ok:
+        return None, reason
+    try:
+        aligned, residual = align_face_from_keypoints(img, keypoints)
+    except Exception as e:
+        return None, f"alignment failed: {e}"
+    if residual > KEYPOINT_MAX_RESIDUAL:
+        return None, f"alignment residual {residual:.1f}px"
+    return aligned, "ok"
+
+
+def recognize_faces_from_keypoints(
+    img, keypoints_list, det_scores=None, fallback_imgs=None, admit_checks=None
+):
+    """
+    Recognize faces already located by an upstream detector (MediaPipe),
+    skipping the SCRFD pass. keypoints are (x, y) pixels in img, in MediaPipe
+    order: right eye, left eye, nose tip, mouth center (extra points ignored).
+    Every aligned face goes through ArcFace in one batch and the index in one
+    search. Faces whose keypoints are unusable fall back to SCRFD on their
+    crop individually.
+    admit_checks: optional per-face admit callables (see process_face_match)
+    Returns: one result dict per face, in input order
+    """
+    count = len(keypoints_list)
+    det_scores = list(det_scores) if det_scores is not None else [None] * count
+    fallback_imgs = list(fallback_imgs) if fallback_imgs is not None else [None] * count
+    admit_checks = list(admit_checks) if admit_checks is not None else [None] * count
+
+    snapshot, error_results = get_ready_snapshot()
+    if error_results:
+        return [dict(error_results[0]) for _ in range(count)]
+
+    results = [None] * count
+    aligned_faces = []
+    aligned_slots = []
+    for i, keypoints in enumerate(keypoints_list):
+        aligned, reason = align_for_recognition(img, keypoints, det_scores[i])
+        if aligned is not None:
+            aligned_faces.append(aligned)
+            aligned_slots.append(i)
+            continue
+
+        print(f"[DEBUG] Face {i}: keypoint alignment skipped ({reason}), falling back to SCRFD")
+        if fallback_imgs[i] is not None:
+            results[i] = recognize_from_image(
+                fallback_imgs[i], face_ratio=FACE_RATIO_CROP, admit=admit_checks[i]
+            )[0]
+        else:
+            results[i] = recognize_from_image(img, admit=admit_checks[i])[0]
+
+    if aligned_faces:
+        try:
+            matches = match_face_embeddings(embed_aligned_faces(aligned_faces), snapshot)
+        except Exception as e:
+            print(f"[ERROR] Batch face recognition error: {e}")
+            for slot in aligned_slots:
+                results[slot] = build_recognition_error(e)
+            return results
+
+        for slot, match in zip(aligned_slots, matches):
+            try:
+                results[slot] = process_face_match(*match, admit=admit_checks[slot])
+            except Exception as e:
+                print(f"[ERROR] Face recognition error: {e}")
+                results[slot] = build_recognition_error(e)
+
+    return results
+
+
+def build_recognition_error(error):
+    return {
+        "status": False,
+        "emp_full_name": "Recognition Error",
+        "message": str(error),
+        "similarity": 0.0,
+        "status_icon": "❌",
+    }
+
+
 def detect_and_predict(frame):
     """Main function called by the GUI for face recognition - FIXED VERSION"""
     try:
@@ -1224,34 +2043,18 @@ def detect_and_predict(frame):
 
 
 def should_rebuild_index():
-    """Check if face index needs to be rebuilt due to new images"""
-    global face_codes
-
+    """Check if profile images were added or removed since the index was built"""
     try:
         if not os.path.exists(IMG_DIR):
-            return False
+            return bool(_indexed_images)
 
-        current_images = [
-            f
+        current_codes = {
+            os.path.splitext(f)[0]
             for f in os.listdir(IMG_DIR)
-            if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))
-        ]
-        current_codes = [os.path.splitext(f)[0] for f in current_images]
-
-        # If we have dummy index and now we have real images
-        if len(face_codes) == 1 and face_codes[0] == "DUMMY" and len(current_codes) > 0:
-            return True
-
-        # If number of images changed
-        real_face_codes = [code for code in face_codes if code != "DUMMY"]
-        if len(current_codes) != len(real_face_codes):
-            return True
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        }
 
-        # If image names changed
-        if set(current_codes) != set(real_face_codes):
-            return True
-
-        return False
+        return current_codes != set(_indexed_images.keys())
 
     except Exception as e:
         print(f"[ERROR] Error checking if rebuild needed: {e}")
@@ -1259,8 +2062,23 @@ def should_rebuild_index():
 
 
 def force_rebuild_index():
-    """Force rebuild the face index (call this after adding new employees)"""
-    return rebuild_face_index()
+    """
+    Update the face index after profile images changed (call this after
+    adding new employees). Only added, changed or removed images are encoded.
+    Blocks until the new snapshot is published - call it from a worker
+    thread, or use request_index_sync() to run it in the background.
+    """
+    global model, _index_initialized
+    if model is None:
+        model = load_insightface_model()
+    load_employee_thresholds()
+    with _index_write_lock:
+        if not _index_initialized:
+            _index_initialized = True
+            loaded, _ = load_index_state()
+            if not loaded:
+                return rebuild_face_index()
+        return sync_face_index()
 
 
 # ---------------------- Enhanced Utility Functions ----------------------
@@ -1280,9 +2098,14 @@ def get_system_info():
         "img_dir": IMG_DIR,
         "db_path": DB_PATH,
         "is_frozen": getattr(sys, "frozen", False),
-        "loaded_faces": len([code for code in face_codes if code != "DUMMY"]),
-        "face_codes": [code for code in face_codes if code != "DUMMY"],
+        "loaded_faces": len(get_active_snapshot()),
+        "loaded_employees": get_active_snapshot().identity_count,
+        "face_codes": get_active_snapshot().codes,
         "recognition_threshold": THRESHOLD,
+        "identity_margin": IDENTITY_MARGIN,
+        "calibrated_thresholds": len(_employee_thresholds),
+        "punch_cooldown": get_punch_cooldown_stats(),
+        "face_quality": get_quality_stats(),
         "current_date": get_current_date_str(),
         "current_time": get_current_time_str(),
     }
@@ -0,0 +1,223 @@
+import threading
+import cv2
+import numpy as np
+from face_quality import QUALITY_THRESHOLDS
+
+# ---------------------- Cascade Thresholds ----------------------
+# Cheap checks run before the liveness CNN. A stage that is sure of a crop
+# lets a track the model has not scored yet skip the model for that frame
+# (see FaceTrack.add_cascade_verdict); everything else goes on to the model.
+# Tune against get_cascade_stats().
+SPOOF_CASCADE_THRESHOLDS = {
+    "screen_peak_ratio": 60.0,  # strongest high-frequency FFT peak / median (moire)
+    "screen_min_hf_ratio": 0.02,  # share of spectral energy above SPOOF_HF_RADIUS
+    "print_min_saturation": 18.0,  # mean HSV saturation - greyscale prints fall below
+    # Share of bright, unsaturated face pixels (glare on glossy prints). Never
+    # stricter than the quality gate, which already passes faces up to this
+    "print_max_specular": QUALITY_THRESHOLDS["max_bright_fraction"],
+    # Mean residual (0-255) of a repeated frame (frozen or injected feed). Still
+    # live faces measure 0.13-0.65 from sensor noise alone (sigma 1-4)
+    "motion_static_max": 0.05,
+    "motion_live_min": 2.0,  # natural non-rigid motion range
+    "motion_live_max": 12.0,
+}
+
+SPOOF_SAMPLE_SIZE = 128  # FFT patch / colour statistics crop size
+SPOOF_THUMB_SIZE = 32  # motion thumbnails
+SPOOF_HF_RADIUS = 0.2  # cycles per pixel (Nyquist is 0.5)
+SPOOF_MOTION_MIN_FRAMES = 2  # thumbnails needed before motion can settle a crop
+SPOOF_SUSPICION_FACTOR = 0.5  # fraction of a spoof threshold that blocks a live verdict
+
+# Motion alone cannot tell a face from a hand-held print or a video replay,
+# so "clearly live" motion only skips the CNN when this is enabled
+SPOOF_SETTLE_LIVE_BY_MOTION = False
+SPOOF_LOG_EVERY = 100  # print stage hit rates every N crops
+
+
+# ---------------------- Cascade Statistics ----------------------
+class CascadeStats:
+    """Counters of crops settled by each stage and passed on to the CNN"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.assessed = 0
+        self.settled_by_stage = {}
+
+    def record(self, stage):
+        with self._lock:
+            self.assessed += 1
+            self.settled_by_stage[stage] = self.settled_by_stage.get(stage, 0) + 1
+            should_log = self.assessed % SPOOF_LOG_EVERY == 0
+
+        if should_log:
+            stats = self.snapshot()
+            rates = ", ".join(
+                f"{stage} {count} ({count * 100.0 / stats['assessed']:.1f}%)"
+                for stage, count in sorted(stats["settled_by_stage"].items())
+            )
+            print(f"[INFO] Spoof cascade: {stats['assessed']} crops - {rates}")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "assessed": self.assessed,
+                "settled_by_stage": dict(self.settled_by_stage),
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def get_cascade_stats():
+    return cascade_stats.snapshot()
+
+
+# ---------------------- Cascade Measures ----------------------
+_window = np.outer(np.hanning(SPOOF_SAMPLE_SIZE), np.hanning(SPOOF_SAMPLE_SIZE)).astype(
+    np.float32
+)
+_freq = np.fft.fftfreq(SPOOF_SAMPLE_SIZE)
+_radius = np.sqrt(_freq[:, None] ** 2 + _freq[None, :] ** 2)
+_high_freq = _radius >= SPOOF_HF_RADIUS
+_not_dc = _radius > 0
+
+
+def center_patch(gray, size=SPOOF_SAMPLE_SIZE):
+    """Centre size x size patch at native resolution - downscaling would average the moire away"""
+    h, w = gray.shape[:2]
+    if h < size or w < size:
+        return cv2.resize(gray, (size, size), interpolation=cv2.INTER_LINEAR)
+    top, left = (h - size) // 2, (w - size) // 2
+    return gray[top : top + size, left : left + size]
+
+
+def measure_moire(gray):
+    """
+    Screen indicators from the spectrum of a SPOOF_SAMPLE_SIZE grey patch: pixel
+    grids and moire put isolated, strong peaks at high frequencies.
+    Returns: (peak_ratio, hf_ratio)
+    """
+    sample = gray.astype(np.float32)
+    sample -= sample.mean()
+    magnitude = np.abs(np.fft.fft2(sample * _window))
+    high = magnitude[_high_freq]
+    peak_ratio = float(high.max() / max(float(np.median(high)), 1e-6))
+
+    power = magnitude * magnitude
+    hf_ratio = float(power[_high_freq].sum() / max(float(power[_not_dc].sum()), 1e-6))
+    return peak_ratio, hf_ratio
+
+
+def measure_colour(face_bgr):
+    """
+    Print indicators: mean saturation and the share of specular pixels
+    (bright and unsaturated - glare on glossy paper or a screen)
+    Returns: (saturation, specular_fraction)
+    """
+    hsv = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2HSV)
+    saturation = hsv[..., 1]
+    specular = (hsv[..., 2] > 240) & (saturation < 30)
+    return float(saturation.mean()), float(specular.mean())
+
+
+def inner_face(face_img, face_box):
+    """The detection box part of a margin crop - the background stays out of colour statistics"""
+    if face_box is None:
+        return face_img
+    h, w = face_img.shape[:2]
+    x1, y1, x2, y2 = [int(round(v)) for v in face_box]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    if x2 - x1 < 8 or y2 - y1 < 8:
+        return face_img
+    return face_img[y1:y2, x1:x2]
+
+
+def make_motion_thumbnail(face_bgr):
+    gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY) if face_bgr.ndim == 3 else face_bgr
+    thumb = cv2.resize(gray, (SPOOF_THUMB_SIZE, SPOOF_THUMB_SIZE), interpolation=cv2.INTER_AREA)
+    return thumb.astype(np.float32)
+
+
+def measure_motion(thumbnails):
+    """
+    Frame-to-frame change of a track's face thumbnails after removing the
+    global shift (phase correlation), so only non-rigid change counts.
+    Returns: list of mean absolute residuals, one per consecutive pair
+    """
+    residuals = []
+    border = SPOOF_THUMB_SIZE // 8
+    for prev, cur in zip(thumbnails, list(thumbnails)[1:]):
+        (dx, dy), _ = cv2.phaseCorrelate(prev, cur)
+        shift = np.float32([[1, 0, -dx], [0, 1, -dy]])
+        aligned = cv2.warpAffine(
+            cur, shift, (SPOOF_THUMB_SIZE, SPOOF_THUMB_SIZE), borderMode=cv2.BORDER_REFLECT
+        )
+        diff = np.abs(aligned - prev)[border:-border, border:-border]
+        residuals.append(float(diff.mean()))
+    return residuals
+
+
+# ---------------------- Spoof Cascade ----------------------
+def run_spoof_cascade(face_img, thumbnails=None, thresholds=None, face_box=None):
+    """
+    Cheap anti-spoof stages ahead of the liveness CNN.
+    face_img: BGR crop; face_box: detection box (x1, y1, x2, y2) inside the
+    crop, for the colour statistics; thumbnails: the track's motion
+    thumbnails (the caller appends one every frame), checked once they hold
+    SPOOF_MOTION_MIN_FRAMES
+    Returns: dict with verdict (True live / False spoof / None - run the CNN),
+    stage (the stage that settled it, or "cnn") and scores
+    """
+    limits = dict(SPOOF_CASCADE_THRESHOLDS)
+    if thresholds:
+        limits.update(thresholds)
+    suspicion = SPOOF_SUSPICION_FACTOR
+
+    def settle(verdict, stage, scores):
+        cascade_stats.record(stage)
+        return {"verdict": verdict, "stage": stage, "scores": scores}
+
+    if face_img is None or face_img.size == 0 or face_img.ndim != 3:
+        return settle(None, "cnn", {})
+
+    # Stage 1: screens - moire / pixel-grid peaks in the spectrum
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    peak_ratio, hf_ratio = measure_moire(center_patch(gray))
+    scores = {"peak_ratio": peak_ratio, "hf_ratio": hf_ratio}
+    if peak_ratio >= limits["screen_peak_ratio"] and hf_ratio >= limits["screen_min_hf_ratio"]:
+        return settle(False, "screen", scores)
+
+    # Stage 2: prints - greyscale paper or strong glare on the face itself
+    sample = cv2.resize(
+        inner_face(face_img, face_box),
+        (SPOOF_SAMPLE_SIZE, SPOOF_SAMPLE_SIZE),
+        interpolation=cv2.INTER_AREA,
+    )
+    saturation, specular = measure_colour(sample)
+    scores.update({"saturation": saturation, "specular": specular})
+    if saturation < limits["print_min_saturation"] or specular > limits["print_max_specular"]:
+        return settle(False, "print", scores)
+
+    # Stage 3: motion across the tracker
+    if thumbnails is not None:
+        if len(thumbnails) >= SPOOF_MOTION_MIN_FRAMES:
+            residuals = measure_motion(thumbnails)
+            scores["motion"] = residuals
+            if max(residuals) < limits["motion_static_max"]:
+                return settle(False, "motion_static", scores)
+
+            suspicious = (
+                peak_ratio >= limits["screen_peak_ratio"] * suspicion
+                or specular > limits["print_max_specular"] * suspicion
+            )
+            natural = all(
+                limits["motion_live_min"] <= r <= limits["motion_live_max"] for r in residuals
+            )
+            if SPOOF_SETTLE_LIVE_BY_MOTION and natural and not suspicious:
+                return settle(True, "motion_live", scores)
+
+    return settle(None, "cnn", scores)
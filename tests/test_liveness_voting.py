@@ -0,0 +1,54 @@
+import os
+import cv2
+import numpy as np
+from face_tracker import FaceTrack, LIVENESS_CASCADE_HITS
+from spoof_cascade import make_motion_thumbnail, run_spoof_cascade
+
+LIVENESS_THRESHOLD = 0.5
+PROFILE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "profile_images", "FD001.jpg")
+
+
+def still_live_frames(count, sigma=3.0, seed=0):
+    """Margin crops of a face that does not move, with camera sensor noise only"""
+    rng = np.random.default_rng(seed)
+    img = cv2.resize(cv2.imread(PROFILE_IMAGE), (640, 480))
+    crop = img[100:380, 180:460].astype(np.float32)
+    return [
+        np.clip(crop + rng.normal(0.0, sigma, crop.shape), 0, 255).astype(np.uint8)
+        for _ in range(count)
+    ]
+
+
+def test_still_live_face_is_not_flagged_static():
+    track = FaceTrack(1, (0, 0, 280, 280), 0.9, 0.0)
+    for frame in still_live_frames(4):
+        track.thumbnails.append(make_motion_thumbnail(frame))
+        cascade = run_spoof_cascade(frame, track.thumbnails, face_box=(40, 40, 240, 240))
+        assert cascade["stage"] != "motion_static"
+
+
+def test_cascade_hit_does_not_outvote_undecided_model_score():
+    track = FaceTrack(1, (0, 0, 280, 280), 0.9, 0.0)
+    assert track.add_liveness_score(0.3, LIVENESS_THRESHOLD) is None
+
+    # A heuristic spoof verdict after the model has scored the track goes back to the model
+    assert track.add_cascade_verdict(False) is False
+    assert track.liveness is None
+
+    assert track.add_liveness_score(0.3, LIVENESS_THRESHOLD) is True
+
+
+def test_cascade_settles_only_after_agreeing_hits():
+    track = FaceTrack(1, (0, 0, 280, 280), 0.9, 0.0)
+    for _ in range(LIVENESS_CASCADE_HITS - 1):
+        assert track.add_cascade_verdict(False) is True
+        assert track.liveness is None
+    assert track.add_cascade_verdict(False) is True
+    assert track.liveness is False
+
+
+def test_unsure_cascade_hands_track_to_model():
+    track = FaceTrack(1, (0, 0, 280, 280), 0.9, 0.0)
+    track.add_cascade_verdict(False)
+    assert track.add_cascade_verdict(None) is False
+    assert len(track.cascade_votes) == 0